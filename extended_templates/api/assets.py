@@ -23,23 +23,28 @@
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
-import hashlib, logging, os
+import logging, os
 
-import boto3
 import botocore.exceptions
 from django.db import transaction
 from rest_framework import parsers, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListCreateAPIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response as HttpResponse
 
 from .serializers import AssetSerializer, MediaItemListSerializer
 from .. import settings
-from ..compat import force_str, gettext_lazy as _, urlparse, urlunparse
+from ..backends.s3 import copy_s3_object, get_s3_client
+from ..compat import (force_str, gettext_lazy as _, unquote, urlparse,
+    urlunparse)
+from ..catalog import (get_storage_prefix, has_media_catalog, index_media,
+    reconcile_media_catalog, unindex_media)
 from ..docs import extend_schema, OpenApiResponse
+from ..helpers import AsyncViewMixin
 from ..mixins import AccountMixin
-from ..models import MediaTag
+from ..models import MediaItem, MediaTag
+from ..uploadhandler import get_s3_object_sha256, get_uploaded_file_sha256
 from ..utils import _get_media_prefix, validate_title, get_default_storage
 
 
@@ -48,10 +53,26 @@ LOGGER = logging.getLogger(__name__)
 URL_PATH_SEP = '/'
 
 
+class AssetCursorPagination(CursorPagination):
+    """
+    Pages through assets by modification time.
+
+    Pagination only applies when the client passes a `page_size`
+    in the query string. Otherwise all assets are returned.
+    """
+    ordering = ('updated_at', 'pk')
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
 class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
     """
     Lists uploaded static asset files
 
+    Passing a ``page_size`` in the query string pages through the assets
+    by modification time, following the ``next`` and ``previous`` links.
+
     **Examples
 
     .. code-block:: http
@@ -78,7 +99,7 @@ class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
     replace_stored = False
     content_type = None
     serializer_class = AssetSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = AssetCursorPagination
     parser_classes = (parsers.JSONParser, parsers.FormParser,
         parsers.MultiPartParser, parsers.FileUploadParser)
 
@@ -89,49 +110,99 @@ class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
         return location
 
 
-    def list_media(self, storage, includes=None, prefix='.'):
+    def get_media_items(self, storage, prefix='.'):
         """
-        Returns a list of media from storage
+        Returns the media indexed for storage, building the index
+        the first time the storage is listed.
         """
-        assets = []
-        try:
-            dirs, files = storage.listdir(prefix)
-            for asset in files:
-                if prefix and prefix != '.':
-                    asset = URL_PATH_SEP.join([prefix, asset])
-                location = storage.url(asset)
-                # The URL might contain temporary auth/permission tokens
-                parts = urlparse(location)
-                permanent_location = urlunparse(
-                    (parts.scheme, parts.netloc, parts.path, None, None, None))
-                location = self.resolve_asset_location(location)
-                if includes is None or location in includes:
-                    media_tags = MediaTag.objects.filter(
-                        location=permanent_location)
-                    assets += [{
-                        'location': location,
-                        'updated_at': storage.get_modified_time(asset),
-                        'tags': media_tags.values_list('tag', flat=True)
-                    }]
-            for asset_dir in dirs:
-                if prefix and prefix != '.':
-                    asset_dir = URL_PATH_SEP.join([prefix, asset_dir])
-                assets += self.list_media(storage, includes, prefix=asset_dir)
-        except OSError:
-            if storage.exists('.'):
+        storage_prefix = get_storage_prefix(storage)
+        if not has_media_catalog(storage):
+            # The catalog for this storage was never built.
+            try:
+                reconcile_media_catalog(storage)
+            except OSError:
+                if storage.exists('.'):
+                    LOGGER.exception("Unable to list objects in %s.",
+                        storage.__class__.__name__)
+                    raise ValidationError({
+                        'detail': _("cannot access assets storage.")})
+            except (botocore.exceptions.ClientError,
+                    botocore.exceptions.LoginRefreshRequired):
                 LOGGER.exception(
-                    "Unable to list objects in %s.", storage.__class__.__name__)
+                    "Unable to list objects in 's3://%s/%s/%s'.",
+                    storage.bucket_name, storage.location, prefix)
                 raise ValidationError({
                     'detail': _("cannot access assets storage.")})
 
-        except (botocore.exceptions.ClientError,
-                botocore.exceptions.LoginRefreshRequired):
-            LOGGER.exception(
-                "Unable to list objects in 's3://%s/%s/%s'.",
-                storage.bucket_name, storage.location, prefix)
-            raise ValidationError({
-                'detail': _("cannot access assets storage.")})
+        media_items = MediaItem.objects.filter(prefix=storage_prefix)
+        if prefix and prefix != '.':
+            media_items = media_items.filter(
+                key__startswith=prefix.rstrip(URL_PATH_SEP) + URL_PATH_SEP)
+        return media_items
+
+    def get_media_items_at(self, storage, locations):
+        """
+        Returns the media indexed for storage at *locations*, as passed
+        by API clients.
+        """
+        base_url_pat = self.resolve_asset_location('')
+        parts = urlparse(storage.url(''))
+        base_storage_pat = urlunparse(
+            (parts.scheme, parts.netloc, parts.path, None, None, None))
+        keys = []
+        for location in locations:
+            if not location:
+                continue
+            permanent_location = resolve_permanent_location(location,
+                storage, base_url_pat=base_url_pat)
+            if permanent_location.startswith(base_storage_pat):
+                keys += [unquote(permanent_location[len(base_storage_pat):])]
+        return self.get_media_items(storage).filter(key__in=keys)
+
+    def list_media(self, storage, includes=None, prefix='.',
+                   media_items=None, page=None):
+        """
+        Returns a list of media from the index of media for storage
 
+        When *page* is specified, only the media items in *page* are listed.
+        """
+        if page is not None:
+            media_items = page
+        elif media_items is None:
+            media_items = self.get_media_items(
+                storage, prefix=prefix).order_by('updated_at')
+        assets = []
+        for media_item in media_items:
+            location = storage.url(media_item.key)
+            # The URL might contain temporary auth/permission tokens
+            parts = urlparse(location)
+            permanent_location = urlunparse(
+                (parts.scheme, parts.netloc, parts.path, None, None, None))
+            location = self.resolve_asset_location(location)
+            if includes is None or location in includes:
+                assets += [{
+                    'location': location,
+                    'permanent_location': permanent_location,
+                    'updated_at': media_item.updated_at,
+                    'tags': []
+                }]
+
+        # Loads the tags for all assets in a single query. When listing
+        # all assets, selecting by prefix avoids a huge `IN` clause.
+        if page is None and includes is None:
+            parts = urlparse(storage.url(''))
+            media_tags = MediaTag.objects.filter(
+                location__startswith=urlunparse(
+                (parts.scheme, parts.netloc, parts.path, None, None, None)))
+        else:
+            media_tags = MediaTag.objects.filter(location__in=[
+                asset['permanent_location'] for asset in assets])
+        tags_by_location = {}
+        for location, tag in media_tags.values_list('location', 'tag'):
+            tags_by_location.setdefault(location, []).append(tag)
+        for asset in assets:
+            asset['tags'] = tags_by_location.get(
+                asset.pop('permanent_location'), [])
         return assets
 
 
@@ -142,23 +213,32 @@ class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
 
     def get(self, request, *args, **kwargs):
         #pylint:disable=unused-argument,unused-variable
-        locations = None
+        storage = get_default_storage(request, self.account)
+        media_items = self.get_media_items(storage)
         search = request.GET.get('q')
         if search:
             validate_title(search)
-            locations = MediaTag.objects.filter(tag__icontains=search)\
-                .values_list('location', flat=True)
-        assets = self.list_media(
-            get_default_storage(request, self.account), includes=locations)
+            parts = urlparse(storage.url(''))
+            base_location = urlunparse(
+                (parts.scheme, parts.netloc, parts.path, None, None, None))
+            media_items = media_items.filter(key__in=[
+                unquote(location[len(base_location):]) for location in
+                MediaTag.objects.filter(tag__icontains=search,
+                    location__startswith=base_location).values_list(
+                    'location', flat=True)])
+        page = self.paginate_queryset(media_items)
+        if page is None:
+            # No `page_size` was requested. We return all assets, which is
+            # what `djaodjin-sidebar-gallery` expects.
+            assets = self.list_media(
+                storage, media_items=media_items.order_by('updated_at'))
+            results = AssetSerializer(many=True).to_representation(assets)
+            return self.get_paginated_response(results)
+        assets = self.list_media(storage, page=page)
         results = AssetSerializer(many=True).to_representation(assets)
-        return self.get_paginated_response(results)
+        return self.paginator.get_paginated_response(results)
 
     def get_paginated_response(self, data):
-        # XXX - Deactivate pagination until not
-        # implemented in djaodjin-sidebar-gallery
-        # page = self.paginate_queryset(queryset['results'])
-        # if page is not None:
-        #     queryset = {'count': len(page), 'results' : page}
         total_count = len(data)
         # sort assets by updated_at to sort by created_at.
         # Media are not updated, so updated_at = created_at
@@ -213,8 +293,9 @@ class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
         #pylint: disable=unused-variable,unused-argument,too-many-locals
         storage = get_default_storage(request, self.account,
             base_url=self.request.build_absolute_uri(settings.MEDIA_URL))
-        assets = self.list_media(storage,
-            includes=[request.query_params.get('location')])
+        locations = [request.query_params.get('location')]
+        assets = self.list_media(storage, includes=locations,
+            media_items=self.get_media_items_at(storage, locations))
         if not assets:
             return HttpResponse({}, status=status.HTTP_404_NOT_FOUND)
 
@@ -225,15 +306,20 @@ class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
         last_storage_part = parts.path.strip(URL_PATH_SEP).split(
             URL_PATH_SEP)[-1]
         resp_status = status.HTTP_200_OK
+        permanent_locations = []
         for item in assets:
             # convert `/api/{profile}/assets/{path}` to a URL on S3.
             permanent_location = resolve_permanent_location(item['location'],
                 storage, base_url_pat=base_url_pat)
             if permanent_location.startswith(base_storage_pat):
-                storage.delete(permanent_location[len(base_storage_pat):])
+                # Storage keys (and the index) are not URL-quoted.
+                key_name = unquote(permanent_location[len(base_storage_pat):])
+                storage.delete(key_name)
+                unindex_media(storage, key_name)
             else:
                 resp_status = status.HTTP_404_NOT_FOUND
-            MediaTag.objects.filter(location=permanent_location).delete()
+            permanent_locations += [permanent_location]
+        MediaTag.objects.filter(location__in=permanent_locations).delete()
         return HttpResponse({'detail': _('Media correctly deleted.')},
             status=resp_status)
 
@@ -283,29 +369,31 @@ class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
         serializer.is_valid(raise_exception=True)
 
         storage = get_default_storage(request, self.account)
-        assets = self.list_media(storage, includes=[item.get('location')
-                for item in serializer.validated_data['items']])
+        locations = [item.get('location')
+            for item in serializer.validated_data['items']]
+        assets = self.list_media(storage, includes=locations,
+            media_items=self.get_media_items_at(storage, locations))
         if not assets:
             return HttpResponse({}, status=status.HTTP_404_NOT_FOUND)
 
         base_url_pat = self.resolve_asset_location('')
         tags = [tag for tag in serializer.validated_data.get('tags') if tag]
+        # convert `/api/{profile}/assets/{path}` to a URL on S3.
+        permanent_locations = [resolve_permanent_location(item['location'],
+            storage, base_url_pat=base_url_pat) for item in assets]
+        with transaction.atomic():
+            # Remove tags which are no more set for the permanent_location.
+            MediaTag.objects.filter(
+                location__in=permanent_locations).exclude(
+                tag__in=tags).delete()
+            MediaTag.objects.bulk_create([
+                MediaTag(location=permanent_location, tag=tag)
+                for permanent_location in permanent_locations
+                for tag in tags], ignore_conflicts=True)
+
+        # Update tags returned by the API.
         for item in assets:
-            # convert `/api/{profile}/assets/{path}` to a URL on S3.
-            permanent_location = resolve_permanent_location(item['location'],
-                storage, base_url_pat=base_url_pat)
-            with transaction.atomic():
-                media_tags = MediaTag.objects.filter(
-                    location=permanent_location)
-                for tag in tags:
-                    MediaTag.objects.get_or_create(
-                        location=permanent_location, tag=tag)
-                # Remove tags which are no more set for the permanent_location.
-                media_tags.exclude(tag__in=tags).delete()
-
-            # Update tags returned by the API.
-            media_tags = MediaTag.objects.filter(location=permanent_location)
-            item['tags'] = media_tags.values_list('tag', flat=True)
+            item['tags'] = tags
 
         serializer = self.serializer_class(
             sorted(assets, key=lambda x: x['updated_at']), many=True)
@@ -314,6 +402,13 @@ class ListUploadAssetAPIView(AccountMixin, ListCreateAPIView):
         return http_resp
 
 
+class AsyncListUploadAssetAPIView(AsyncViewMixin, ListUploadAssetAPIView):
+    """
+    ``ListUploadAssetAPIView`` which lists and uploads assets in a worker
+    thread under ASGI, so a slow storage does not block other requests.
+    """
+
+
 def process_upload(request, storage=None, account=None, is_public_asset=None,
                    store_hash=True, replace_stored=False, content_type=None,
                    media_prefix=None):
@@ -334,11 +429,9 @@ def process_upload(request, storage=None, account=None, is_public_asset=None,
             prefix += URL_PATH_SEP
         ext = os.path.splitext(src_key_name)[1]
 
-        s3_client = boto3.client('s3')
-        data = s3_client.get_object(Bucket=bucket_name, Key=src_key_name)
-        uploaded_file = data['Body']
-        dst_key_name = "%s%s%s" % (prefix,
-            hashlib.sha256(uploaded_file.read()).hexdigest(), ext)
+        s3_client = get_s3_client()
+        sha, size = get_s3_object_sha256(s3_client, bucket_name, src_key_name)
+        dst_key_name = "%s%s%s" % (prefix, sha, ext)
         LOGGER.info("copy s3://%s/%s to s3://%s/%s",
                     bucket_name, src_key_name, bucket_name, dst_key_name)
         if is_public_asset:
@@ -352,8 +445,9 @@ def process_upload(request, storage=None, account=None, is_public_asset=None,
             extra_args.update({'ContentType': 'image/jpeg'})
         elif ext in ['.png']:
             extra_args.update({'ContentType': 'image/png'})
-        s3_client.copy({'Bucket': bucket_name, 'Key': src_key_name},
-            bucket_name, dst_key_name, ExtraArgs=extra_args)
+        content_type = extra_args.get('ContentType', content_type)
+        copy_s3_object(bucket_name, src_key_name, bucket_name, dst_key_name,
+            extra_args=extra_args, s3_client=s3_client)
         # XXX still can't figure out why we get a permission denied
         # on DeleteObject.
         if False:
@@ -370,7 +464,10 @@ def process_upload(request, storage=None, account=None, is_public_asset=None,
             # mimetypes.guess and surprisingly it doesn't get it correct
             # for 'text/css'.
             uploaded_file.content_type = content_type
-        sha = hashlib.sha256(uploaded_file.read()).hexdigest()
+        else:
+            content_type = getattr(uploaded_file, 'content_type', None)
+        size = uploaded_file.size
+        sha = get_uploaded_file_sha256(request, uploaded_file)
 
         # Store filenames with forward slashes, even on Windows
         filename = force_str(uploaded_file.name.replace('\\', '/'))
@@ -390,9 +487,12 @@ def process_upload(request, storage=None, account=None, is_public_asset=None,
         raise ValidationError({'detail':
            _("Either 'location' or 'file' must be specified.")})
 
+    updated_at = storage.get_modified_time(storage_key_name)
+    index_media(storage, storage_key_name, size=size, updated_at=updated_at,
+        sha256=sha, content_type=content_type)
     return ({
         'location': storage.url(storage_key_name),
-        'updated_at': storage.get_modified_time(storage_key_name)
+        'updated_at': updated_at
     }, response_status)
 
 
@@ -104,3 +104,14 @@ class SourceElementSerializer(SourceCodeSerializer):
 
     hints = serializers.ListField(
         child=HintSerializer(), required=False)
+
+
+class TemplateDependenciesSerializer(NoModelSerializer):
+
+    path = serializers.CharField(
+        help_text=_("Name of the template"))
+    dependencies = serializers.ListField(child=serializers.CharField(),
+        help_text=_("Templates loaded by the template"))
+    dependents = serializers.ListField(child=serializers.CharField(),
+        help_text=_("Templates which load the template, directly"\
+            " or transitively"))
@@ -24,23 +24,25 @@
 #pylint: disable=no-member
 from __future__ import unicode_literals
 
-import logging, os, subprocess, tempfile
+import logging, os, stat, tempfile
 
 from bs4 import BeautifulSoup
 from django.conf import settings as django_settings
 from django.http import Http404
 from django.template.base import TemplateSyntaxError
 from django.template.backends.jinja2 import Jinja2 as Jinja2Templates
-from django.template.loader import _engine_list
 from django.utils._os import safe_join
 from jinja2.lexer import Lexer
 from rest_framework import status, generics
 from rest_framework.response import Response
 
-from .serializers import SourceCodeSerializer, SourceElementSerializer
+from .serializers import (SourceCodeSerializer, SourceElementSerializer,
+    TemplateDependenciesSerializer)
 from ..compat import DebugLexer, TokenType, force_str, get_html_engine, six
+from ..helpers import AsyncViewMixin
 from ..mixins import ThemePackageMixin
-from ..themes import check_template, get_theme_dir, get_template_path
+from ..themes import (check_template, get_dependency_graph, get_theme_dir,
+    get_template_path, invalidate_template, unified_diff)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -49,6 +51,12 @@ STATE_BLOCK_BEGIN = 2
 STATE_BLOCK_CONTENT = 3
 STATE_BLOCK_CONTENT_ESCAPE = 4
 
+# Mode of files created by this process. Reading the umask requires
+# to set it, so we do it once at load time rather than per request.
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+_NEW_FILE_MODE = 0o666 & ~_UMASK
+
 
 class ReplaceIdVisitor(object):
 
@@ -173,17 +181,13 @@ class SourceEditAPIView(ThemePackageMixin, generics.GenericAPIView):
                 block_text = dest
                 if six.PY2 and hasattr(block_text, 'encode'):
                     block_text = block_text.encode('utf-8')
-                if not os.path.exists(os.path.dirname(dest_path)):
-                    os.makedirs(os.path.dirname(dest_path))
-                with open(dest_path, 'w') as dest_file:
-                    dest_file.write(block_text)
+                # Files installed through the theme store are read-only
+                # hard links shared between themes. We replace them
+                # instead of writing through them.
+                _replace_file(dest_path, block_text)
                 if django_settings.DEBUG:
-                    try:
-                        cmdline = ['diff', '-u', template_path, dest_path]
-                        LOGGER.info(' '.join(cmdline))
-                        LOGGER.info(subprocess.check_output(cmdline))
-                    except subprocess.CalledProcessError:
-                        pass
+                    LOGGER.info("diff -u %s %s", template_path, dest_path)
+                    LOGGER.info(''.join(unified_diff(template_path, dest_path)))
                 found = True
             if found:
                 break
@@ -191,12 +195,8 @@ class SourceEditAPIView(ThemePackageMixin, generics.GenericAPIView):
             raise Http404()
 
         # clear template loaders caches
-        engines = _engine_list(using=None)
-        for engine in engines:
-            try:
-                engine.env.cache.clear()
-            except AttributeError:
-                pass
+        invalidate_template(self.theme, dest_hint.get('name'),
+            template_source=dest, template_path=dest_path)
 
         return Response(self.get_serializer().to_representation({
                 'text': dest,
@@ -313,12 +313,9 @@ class SourceDetailAPIView(ThemePackageMixin, generics.RetrieveUpdateAPIView,
             write_template(template_path, serializer.validated_data['text'])
 
             # clear template loaders caches
-            engines = _engine_list(using=None)
-            for engine in engines:
-                try:
-                    engine.env.cache.clear()
-                except AttributeError:
-                    pass
+            invalidate_template(self.theme, relative_path,
+                template_source=serializer.validated_data['text'],
+                template_path=template_path)
 
         except TemplateSyntaxError as err:
             LOGGER.debug("%s", err, extra={'request': request})
@@ -329,12 +326,69 @@ class SourceDetailAPIView(ThemePackageMixin, generics.RetrieveUpdateAPIView,
         relative_path = self.kwargs.get('page')
         theme_base = get_theme_dir(self.theme)
         template_path = safe_join(theme_base, 'templates', relative_path)
-        write_template(template_path, '''{% extends "base.html" %}
+        template_source = '''{% extends "base.html" %}
 
 {% block content %}
 <h1>Lorem Ipsum</h1>
 {% endblock %}
-''')
+'''
+        write_template(template_path, template_source)
+        invalidate_template(self.theme, relative_path,
+            template_source=template_source, template_path=template_path)
+
+
+class AsyncSourceDetailAPIView(AsyncViewMixin, SourceDetailAPIView):
+    """
+    ``SourceDetailAPIView`` which reads, checks and writes template sources
+    in a worker thread under ASGI.
+    """
+
+
+class TemplateDependenciesAPIView(ThemePackageMixin, generics.GenericAPIView):
+    """
+    Lists dependencies between templates
+
+    Returns the templates a template loads through ``extends``,
+    ``include``, ``import`` or ``from`` directives, and the templates
+    which load it, directly or transitively. When no template is
+    specified, returns the dependencies of all templates in the theme.
+
+    **Examples
+
+    .. code-block:: http
+
+        GET /api/themes/dependencies/base.html HTTP/1.1
+
+    responds
+
+    .. code-block:: json
+
+         {
+           "path": "base.html",
+           "dependencies": ["_menubar.html"],
+           "dependents": ["index.html"]
+         }
+    """
+    serializer_class = TemplateDependenciesSerializer
+
+    def get(self, request, *args, **kwargs):
+        #pylint:disable=unused-argument
+        graph = get_dependency_graph(self.theme)
+        relative_path = self.kwargs.get('page')
+        if relative_path:
+            return Response(self.get_serializer().to_representation({
+                'path': relative_path,
+                'dependencies': graph.get_dependencies(relative_path),
+                'dependents': graph.get_dependents(relative_path)}))
+        results = [{
+            'path': template_name,
+            'dependencies': graph.get_dependencies(template_name),
+            'dependents': graph.get_dependents(template_name)}
+            for template_name in sorted(graph.dependencies)]
+        return Response({
+            'count': len(results),
+            'results': self.get_serializer(many=True).to_representation(
+                results)})
 
 
 def _tokens_as_text(buffered_tokens):
@@ -493,15 +547,34 @@ def process_template(visitor, template_string=None, template_path=None):
     return template_string
 
 
-def write_template(template_path, template_source):
-    check_template(template_source)
-    base_dir = os.path.dirname(template_path)
+def _replace_file(path, content):
+    """
+    Writes *content* to a temporary file then renames it to *path*,
+    such that *path* is replaced by a new inode rather than modified
+    in place.
+
+    The new file keeps the permissions of the file it replaces (made
+    writable by the owner again in case it was a read-only link
+    to ``THEME_STORE_ROOT``), or gets the permissions of a newly created
+    file otherwise. Temporary files are only readable by their owner.
+    """
+    base_dir = os.path.dirname(path)
     if not os.path.isdir(base_dir):
         os.makedirs(base_dir)
     with tempfile.NamedTemporaryFile(
             mode='w+t', dir=base_dir, delete=False) as temp_file:
-        if six.PY2 and hasattr(template_source, 'encode'):
-            template_source = template_source.encode('utf-8')
-        temp_file.write(template_source)
-    os.rename(temp_file.name, template_path)
+        if six.PY2 and hasattr(content, 'encode'):
+            content = content.encode('utf-8')
+        temp_file.write(content)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode) | stat.S_IWUSR
+    except FileNotFoundError:
+        mode = _NEW_FILE_MODE
+    os.chmod(temp_file.name, mode)
+    os.replace(temp_file.name, path)
+
+
+def write_template(template_path, template_source):
+    check_template(template_source)
+    _replace_file(template_path, template_source)
     LOGGER.info("pid %d wrote to %s", os.getpid(), template_path)
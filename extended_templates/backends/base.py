@@ -24,12 +24,16 @@
 
 from __future__ import unicode_literals
 
-import codecs, logging, warnings
+import codecs, logging, smtplib, warnings
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
+from itertools import islice
 
 import django
 from django.template import Template, loader
 from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.db import close_old_connections
 from django.template.loader import select_template
 
 from .. import settings
@@ -124,9 +128,21 @@ def _load_backend(path):
 
 class TemplateEmailBackend(object):
 
+    # Number of messages rendered ahead of the ones being sent
+    # by ``send_many``.
+    batch_size = 100
+
     def __init__(self, connection=None):
         self.connection = connection
 
+    @staticmethod
+    def _get_template(template):
+        if isinstance(template, (list, tuple)):
+            return select_template(template)
+        if isinstance(template, six.string_types):
+            return get_template(template)
+        return template
+
     #pylint: disable=invalid-name,too-many-arguments
     def send(self, recipients, template, context=None,
              from_email=None, bcc=None, cc=None, reply_to=None,
@@ -134,13 +150,128 @@ class TemplateEmailBackend(object):
         if not from_email:
             from_email = settings.DEFAULT_FROM_EMAIL
 
-        if isinstance(template, (list, tuple)):
-            tmpl = select_template(template)
-        elif isinstance(template, six.string_types):
-            tmpl = get_template(template)
-        else:
-            tmpl = template
+        tmpl = self._get_template(template)
         tmpl.send(recipients, context,
             from_email=from_email, bcc=bcc, cc=cc, reply_to=reply_to,
             attachments=attachments, connection=self.connection,
             fail_silently=fail_silently)
+
+    #pylint: disable=invalid-name,too-many-arguments,too-many-locals
+    #pylint: disable=too-many-statements,too-many-nested-blocks
+    def send_many(self, messages, template, from_email=None, bcc=None,
+                  cc=None, reply_to=None, attachments=None, workers=None,
+                  context=None, personalized_keys=None, fail_silently=False):
+        """
+        Sends ``template`` once for each (recipients, context) pair
+        in ``messages``.
+
+        When ``personalized_keys`` is specified, the template is rendered
+        only once, with the shared ``context``, and each pair in ``messages``
+        is (recipients, values) where values only contains the variables
+        in ``personalized_keys`` (see ``PersonalizedTemplate``).
+
+        Messages are rendered in a pool of ``workers`` threads while
+        the previously rendered messages are sent through a single
+        connection. A message that cannot be rendered or sent does not
+        stop the others from being sent.
+
+        The connection is always used with ``fail_silently=False`` such that
+        failures are reported per message. When the connection cannot be
+        opened, or drops and cannot be re-opened, the exception is raised,
+        or if *fail_silently* is `True`, all remaining messages are reported
+        as failed.
+
+        Returns the list of (recipients, exception) for the messages
+        that failed.
+        """
+        if not from_email:
+            from_email = settings.DEFAULT_FROM_EMAIL
+
+        tmpl = self._get_template(template)
+        if personalized_keys:
+            tmpl = tmpl.personalize(context, personalized_keys)
+        connection = self.connection
+        if connection is None:
+            connection = get_connection(fail_silently=False)
+
+        def _make_message(recipients, context):
+            try:
+                if hasattr(tmpl, 'make_message'):
+                    return tmpl.make_message(recipients, context,
+                        from_email=from_email, bcc=bcc, cc=cc,
+                        reply_to=reply_to, attachments=attachments,
+                        connection=connection)
+                return None
+            finally:
+                close_old_connections()
+
+        failures = []
+        messages = iter(messages)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def _submit_batch():
+                return [(recipients, context, executor.submit(
+                    _make_message, recipients, context))
+                    for recipients, context in islice(
+                        messages, self.batch_size)]
+
+            def _cancel_remaining(batch):
+                # Returns the recipients of the messages not sent yet.
+                for unused_recipients, unused_context, future in batch:
+                    future.cancel()
+                return [recipients for recipients, unused_context, unused_future
+                    in batch] + [recipients
+                    for recipients, unused_context in messages]
+
+            try:
+                new_conn_created = connection.open()
+            except Exception as err: #pylint:disable=broad-except
+                LOGGER.exception("cannot connect to send %s",
+                    getattr(tmpl, 'name', tmpl))
+                if not fail_silently:
+                    raise
+                return [(recipients, err)
+                    for recipients, unused_context in messages]
+            try:
+                batch = _submit_batch()
+                while batch:
+                    next_batch = _submit_batch()
+                    for idx, (recipients, context, future) in enumerate(
+                            batch):
+                        try:
+                            msg = future.result()
+                            if msg is None:
+                                # Templates without `make_message` send
+                                # the message themselves.
+                                tmpl.send(recipients, context,
+                                    from_email=from_email, bcc=bcc, cc=cc,
+                                    reply_to=reply_to, attachments=attachments,
+                                    connection=connection,
+                                    fail_silently=False)
+                            elif not connection.send_messages([msg]):
+                                # The connection was created with
+                                # `fail_silently=True` by the caller.
+                                raise smtplib.SMTPException(
+                                    "message was not sent")
+                        except Exception as err: #pylint:disable=broad-except
+                            LOGGER.exception("error sending %s to %s",
+                                getattr(tmpl, 'name', tmpl), recipients)
+                            failures += [(recipients, err)]
+                            if isinstance(err, smtplib.SMTPServerDisconnected):
+                                try:
+                                    connection.close()
+                                    connection.open()
+                                except Exception as reconnect_err:
+                                    #pylint:disable=broad-except
+                                    LOGGER.exception("cannot reconnect to"\
+                                        " send %s", getattr(tmpl, 'name', tmpl))
+                                    remaining = _cancel_remaining(
+                                        batch[idx + 1:] + next_batch)
+                                    if not fail_silently:
+                                        raise
+                                    return failures + [(pending, reconnect_err)
+                                        for pending in remaining]
+                    batch = next_batch
+            finally:
+                if new_conn_created:
+                    connection.close()
+        return failures
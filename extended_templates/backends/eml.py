@@ -22,63 +22,107 @@
 # OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import codecs, logging, os, warnings
+import codecs, logging, os, re, threading, uuid, warnings
+from collections import OrderedDict
 
 from bs4 import BeautifulSoup
 from django import VERSION as DJANGO_VERSION
 from django.core.mail import EmailMultiAlternatives
 from django.template import engines
-from django.utils.html import strip_tags
-from django.utils._os import safe_join
+from django.utils.html import escape, strip_tags
 from django.template import TemplateDoesNotExist
 from premailer.premailer import (Premailer as BasePremailer,
     ExternalNotFoundError)
 
 from .. import settings
 from ..compat import (BaseEngine, _dirs_undefined, RemovedInDjango110Warning,
-    urlparse)
-from ..utils import get_assets_dirs
+    force_str, six, urlparse)
+from ..utils import get_asset_resolver, get_assets_dirs
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Unique to this process such that placeholders cannot collide with
+# the content of a template.
+_PLACEHOLDER_SUFFIX = uuid.uuid4().hex
+
+# Maximum number of stylesheets, and of parsed style rules, kept in memory
+# across emails.
+PARSED_CSS_CACHE_SIZE = 64
+
+_STYLESHEETS_CACHE = OrderedDict()
+_STYLE_RULES_CACHE = OrderedDict()
+_CSS_CACHE_LOCK = threading.Lock()
+
+
+def _get_cached(cache, key):
+    with _CSS_CACHE_LOCK:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+    return value
+
+
+def _set_cached(cache, key, value):
+    with _CSS_CACHE_LOCK:
+        cache[key] = value
+        while len(cache) > PARSED_CSS_CACHE_SIZE:
+            cache.popitem(last=False)
+
 
 class Premailer(BasePremailer):
     """
     Special Premail that overrides _load_external in order to search multiple
     paths as well as prevent loading http resources.
+
+    Stylesheets, and the rules parsed out of them, are cached across
+    instances such that sending many emails with the same stylesheets
+    does not read and parse them each time.
     """
 
     def _load_external(self, url):
-        parts = urlparse(url)
-        rel_path = parts.path.strip('/')
-        parts = rel_path.split('/')
-        if len(parts) > 1:
-            path_prefix = parts[0]
-            rel_path_no_prefix = '/'.join(parts[1:])
-        else:
-            path_prefix = ""
-            rel_path_no_prefix = rel_path
-        LOGGER.debug("looking for '%s' in order into directories %s",
+        stylefile = get_asset_resolver().find(
+            urlparse(url).path, strip_prefix=True)
+        if stylefile:
+            LOGGER.debug("looking for '%s' as '%s'... yes", url, stylefile)
+            mtime = os.stat(stylefile).st_mtime_ns
+            cached = _get_cached(_STYLESHEETS_CACHE, stylefile)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            with codecs.open(stylefile, encoding='utf-8') as css_file:
+                css_body = css_file.read()
+            _set_cached(_STYLESHEETS_CACHE, stylefile, (mtime, css_body))
+            return css_body
+        LOGGER.debug("looking for '%s' in directories %s... no",
             url, get_assets_dirs())
-        for base_path in get_assets_dirs():
-            if path_prefix and base_path.endswith(path_prefix):
-                stylefile = safe_join(base_path, rel_path_no_prefix)
-            else:
-                stylefile = safe_join(base_path, rel_path)
-            if os.path.exists(stylefile):
-                LOGGER.debug("looking for '%s' as '%s'... yes", url, stylefile)
-                with codecs.open(stylefile, encoding='utf-8') as css_file:
-                    css_body = css_file.read()
-                return css_body
-            LOGGER.debug("looking for '%s' as '%s'... no", url, stylefile)
         raise ExternalNotFoundError(url)
 
+    def _parse_style_rules(self, css_body, ruleset_index):
+        # Stylesheets loaded through `_load_external` are the same `str`
+        # objects for as long as the file is not modified, so hashing
+        # `css_body` is cheap after the first lookup.
+        key = (css_body, ruleset_index, self.include_star_selectors,
+            getattr(self, 'exclude_pseudoclasses', None),
+            getattr(self, 'disable_validation', None))
+        cached = _get_cached(_STYLE_RULES_CACHE, key)
+        if cached is None:
+            cached = super(Premailer, self)._parse_style_rules(
+                css_body, ruleset_index)
+            _set_cached(_STYLE_RULES_CACHE, key, cached)
+        rules, leftover = cached
+        return list(rules), list(leftover)
+
 
 class EmlTemplateError(Exception):
     pass
 
 
+def _escape_text(text):
+    # The plain text alternative is derived from the HTML content,
+    # where '&', '<' and '>' remain escaped.
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
 class EmlEngine(BaseEngine):
     #pylint: disable=no-member
 
@@ -150,6 +194,26 @@ class EmlEngine(BaseEngine):
         raise TemplateDoesNotExist(template_name)
 
 
+def _make_email_message(recipients, subject, plain_content, html_content,
+                        from_email=None, bcc=None, cc=None, reply_to=None,
+                        attachments=None, connection=None):
+    #pylint: disable=too-many-arguments
+    if not from_email:
+        from_email = settings.DEFAULT_FROM_EMAIL
+    headers = {'Reply-To': reply_to} if reply_to else None
+
+    # XXX implement inline attachments,
+    #     reference: https://djangosnippets.org/snippets/3001/
+    msg = EmailMultiAlternatives(
+        subject, plain_content, from_email, recipients, bcc=bcc, cc=cc,
+        attachments=attachments, headers=headers, connection=connection)
+    if html_content:
+        msg.attach_alternative(html_content, "text/html")
+    LOGGER.debug("From: %s\nTo: %s\nCc: %s\nBcc: %s\nSubject: %s\n\n%s\n",
+        from_email, ', '.join(recipients), cc, bcc, subject, plain_content)
+    return msg
+
+
 class Template(object):
     """
     Sends an email to a list of recipients (i.e. email addresses).
@@ -165,14 +229,9 @@ class Template(object):
     def render(self, context=None, request=None):
         return self.template.render(context=context, request=request)
 
-    #pylint: disable=invalid-name,too-many-arguments
-    def _send(self, recipients, context, from_email=None, bcc=None, cc=None,
-              reply_to=None, attachments=None,
-              connection=None, fail_silently=False):
-        #pylint: disable=too-many-locals
+    def _render_content(self, context):
         subject = None
         plain_content = None
-        headers = {'Reply-To': reply_to} if reply_to else None
         request = getattr(context, 'request', context.get('request', None))
 
         try:
@@ -192,37 +251,119 @@ class Template(object):
             plain_content = strip_tags(soup.find('body').prettify())
             subject = soup.title.string.strip()
 
-        # Create the email, attach the HTML version.
         if not subject:
             raise EmlTemplateError(
                 "Template %s is missing a subject." % self.origin.name)
+        return subject, plain_content, html_content
 
-        # XXX implement inline attachments,
-        #     reference: https://djangosnippets.org/snippets/3001/
-        msg = EmailMultiAlternatives(
-            subject, plain_content, from_email, recipients, bcc=bcc, cc=cc,
-            attachments=attachments, headers=headers, connection=connection)
-        if html_content:
-            msg.attach_alternative(html_content, "text/html")
-        LOGGER.debug("From: %s\nTo: %s\nCc: %s\nBcc: %s\nSubject: %s\n\n%s\n",
-            from_email, ', '.join(recipients), cc, bcc, subject, plain_content)
-        msg.send(fail_silently=fail_silently)
+    def render_content(self, context):
+        """
+        Returns the subject, plain text and (inlined) HTML content
+        of the email rendered with ``context``.
+        """
+        #pylint: disable=no-member
+        if hasattr(context, 'template') and context.template is None:
+            with context.bind_template(self):
+                context.template_name = self.name
+                return self._render_content(context)
+        return self._render_content(context)
+
+    #pylint: disable=invalid-name,too-many-arguments
+    def make_message(self, recipients, context,
+                     from_email=None, bcc=None, cc=None, reply_to=None,
+                     attachments=None, connection=None):
+        """
+        Returns the email message for ``recipients``, rendered
+        with ``context``, without sending it.
+        """
+        subject, plain_content, html_content = self.render_content(context)
+        return _make_email_message(recipients, subject, plain_content,
+            html_content, from_email=from_email, bcc=bcc, cc=cc,
+            reply_to=reply_to, attachments=attachments, connection=connection)
+
+    def personalize(self, context, personalized_keys):
+        """
+        Returns a ``PersonalizedTemplate`` which renders, inlines and
+        converts the email to plain text once for all recipients.
+
+        ``context`` holds the variables shared by all recipients.
+        The variables in ``personalized_keys`` are rendered as placeholders,
+        which are substituted by the value for each recipient when
+        the messages are created.
+        """
+        placeholders = OrderedDict([(key, "xpersonalized%dx%s" % (
+            idx, _PLACEHOLDER_SUFFIX))
+            for idx, key in enumerate(personalized_keys)])
+        if hasattr(context, 'push'):
+            with context.push(**placeholders):
+                content = self.render_content(context)
+        else:
+            context = dict(context if context else {})
+            context.update(placeholders)
+            content = self.render_content(context)
+        return PersonalizedTemplate(self, placeholders, *content)
 
     #pylint: disable=invalid-name,too-many-arguments
     def send(self, recipients, context,
              from_email=None, bcc=None, cc=None, reply_to=None,
              attachments=None, connection=None, fail_silently=False):
-        #pylint: disable=no-member
-        if not from_email:
-            from_email = settings.DEFAULT_FROM_EMAIL
+        msg = self.make_message(recipients, context, from_email=from_email,
+            bcc=bcc, cc=cc, reply_to=reply_to, attachments=attachments,
+            connection=connection)
+        msg.send(fail_silently=fail_silently)
 
-        if hasattr(context, 'template') and context.template is None:
-            with context.bind_template(self):
-                context.template_name = self.name
-                return self._send(recipients, context, from_email=from_email,
-                    bcc=bcc, cc=cc, reply_to=reply_to, attachments=attachments,
-                    connection=connection, fail_silently=fail_silently)
-        else:
-            return self._send(recipients, context, from_email=from_email,
-                bcc=bcc, cc=cc, reply_to=reply_to, attachments=attachments,
-                connection=connection, fail_silently=fail_silently)
+
+class PersonalizedTemplate(object):
+    """
+    Email rendered, inlined and converted to plain text once, with
+    placeholders in lieu of the variables that change for each recipient.
+
+    Personalized variables must be rendered as-is in the template
+    (ex: ``{{first_name}}``, not ``{{user.first_name|title}}``).
+    """
+
+    def __init__(self, template, placeholders, subject, plain_content,
+                 html_content):
+        #pylint: disable=too-many-arguments
+        self.template = template
+        self.name = getattr(template, 'name', None)
+        self.subject = subject
+        self.plain_content = plain_content
+        self.html_content = html_content
+        self.keys = {placeholder: key
+            for key, placeholder in six.iteritems(placeholders)}
+        self.placeholders_re = re.compile(
+            '|'.join(re.escape(placeholder) for placeholder in self.keys))
+
+    def _substitute(self, text, values, escape_func=None):
+        if not text or not self.keys:
+            return text
+        def _value(match):
+            value = force_str(values.get(self.keys[match.group(0)], ""))
+            return escape_func(value) if escape_func else value
+        return self.placeholders_re.sub(_value, text)
+
+    #pylint: disable=invalid-name,too-many-arguments
+    def make_message(self, recipients, values,
+                     from_email=None, bcc=None, cc=None, reply_to=None,
+                     attachments=None, connection=None):
+        """
+        Returns the email message for ``recipients`` with placeholders
+        substituted by ``values``, without sending it.
+        """
+        return _make_email_message(recipients,
+            self._substitute(self.subject, values),
+            self._substitute(self.plain_content, values,
+                escape_func=_escape_text),
+            self._substitute(self.html_content, values, escape_func=escape),
+            from_email=from_email, bcc=bcc, cc=cc, reply_to=reply_to,
+            attachments=attachments, connection=connection)
+
+    #pylint: disable=invalid-name,too-many-arguments
+    def send(self, recipients, values,
+             from_email=None, bcc=None, cc=None, reply_to=None,
+             attachments=None, connection=None, fail_silently=False):
+        msg = self.make_message(recipients, values, from_email=from_email,
+            bcc=bcc, cc=cc, reply_to=reply_to, attachments=attachments,
+            connection=connection)
+        msg.send(fail_silently=fail_silently)
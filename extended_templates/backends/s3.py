@@ -22,13 +22,62 @@
 # OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import os
+import os, threading
 
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from storages.backends.s3 import S3Storage
 
+from .. import settings
 from ..compat import urlparse
 
 
+_S3_CLIENT = None
+_S3_CLIENT_PID = None
+_S3_CLIENT_LOCK = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Returns a S3 client shared by all threads in the process.
+
+    boto3 clients are thread-safe, and re-using one client re-uses
+    the connections in its pool instead of opening new ones on each
+    request.
+    """
+    #pylint:disable=global-statement
+    global _S3_CLIENT, _S3_CLIENT_PID
+    pid = os.getpid()
+    with _S3_CLIENT_LOCK:
+        # Connections cannot be shared with a forked process.
+        if _S3_CLIENT is None or _S3_CLIENT_PID != pid:
+            _S3_CLIENT = boto3.session.Session().client('s3',
+                config=Config(max_pool_connections=max(
+                    10, settings.AWS_S3_COPY_CONCURRENCY)))
+            _S3_CLIENT_PID = pid
+    return _S3_CLIENT
+
+
+def copy_s3_object(src_bucket_name, src_key_name, dst_bucket_name,
+                   dst_key_name, extra_args=None, s3_client=None):
+    """
+    Copies an object from one S3 location to another.
+
+    The copy happens server-side. Objects larger than
+    ``AWS_S3_COPY_PART_SIZE`` are copied in parts, with up to
+    ``AWS_S3_COPY_CONCURRENCY`` parts being copied at the same time.
+    """
+    if s3_client is None:
+        s3_client = get_s3_client()
+    config = TransferConfig(
+        multipart_threshold=settings.AWS_S3_COPY_PART_SIZE,
+        multipart_chunksize=settings.AWS_S3_COPY_PART_SIZE,
+        max_concurrency=settings.AWS_S3_COPY_CONCURRENCY)
+    s3_client.copy({'Bucket': src_bucket_name, 'Key': src_key_name},
+        dst_bucket_name, dst_key_name, ExtraArgs=extra_args, Config=config)
+
+
 def get_package_file_from_s3(package_uri):
     parts = urlparse(package_uri)
     basename = os.path.basename(parts.path)
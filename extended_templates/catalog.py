@@ -0,0 +1,190 @@
+# Copyright (c) 2026, Djaodjin Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Index of the media files stored for accounts
+
+Uploads and deletes through the API keep the index up-to-date. Files
+added or removed directly in the storage are picked up by running
+``reconcile_media_catalog`` (see the management command of the same name).
+"""
+from __future__ import unicode_literals
+
+import logging, mimetypes, re
+
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Min
+
+from .models import MediaItem, MediaTag
+
+
+LOGGER = logging.getLogger(__name__)
+
+URL_PATH_SEP = '/'
+
+# Files uploaded with `store_hash=True` are named after the SHA-256
+# of their content.
+SHA256_NAME_RE = re.compile(r'^([0-9a-f]{64})(\.[^/]*)?$')
+
+# Prefixes of the storages reconciled by this process, such that the files
+# in an empty storage are not listed again on every request.
+_RECONCILED_PREFIXES = set()
+
+
+def get_storage_prefix(storage):
+    """
+    Returns a string that identifies where ``storage`` stores its files.
+    """
+    location = getattr(storage, 'location', '')
+    bucket_name = getattr(storage, 'bucket_name', None)
+    if bucket_name:
+        return "s3://%s/%s" % (bucket_name, location.strip(URL_PATH_SEP))
+    return location
+
+
+def has_media_catalog(storage):
+    """
+    Returns `True` if the index of media for ``storage`` was built.
+    """
+    prefix = get_storage_prefix(storage)
+    if prefix in _RECONCILED_PREFIXES:
+        return True
+    return MediaItem.objects.filter(prefix=prefix).exists()
+
+
+def _get_sha256_from_key(key):
+    look = SHA256_NAME_RE.match(key.split(URL_PATH_SEP)[-1])
+    if look:
+        return look.group(1)
+    return ""
+
+
+def _list_storage_objects(storage, prefix=''):
+    """
+    Yields (key, size, updated_at) for each file in ``storage``.
+    """
+    bucket = getattr(storage, 'bucket', None)
+    if bucket is not None:
+        # S3 returns sizes and modification times along with the listing,
+        # so we avoid one HEAD request per object.
+        location = storage.location.strip(URL_PATH_SEP)
+        if location:
+            location += URL_PATH_SEP
+        for obj in bucket.objects.filter(Prefix=location):
+            key = obj.key[len(location):]
+            if key and not key.endswith(URL_PATH_SEP):
+                yield key, obj.size, obj.last_modified
+        return
+    dirs, files = storage.listdir(prefix if prefix else '.')
+    for filename in files:
+        key = URL_PATH_SEP.join([prefix, filename]) if prefix else filename
+        yield key, storage.size(key), storage.get_modified_time(key)
+    for dirname in dirs:
+        for item in _list_storage_objects(storage, prefix=(
+                URL_PATH_SEP.join([prefix, dirname]) if prefix else dirname)):
+            yield item
+
+
+def index_media(storage, key, size=None, updated_at=None, sha256=None,
+                content_type=None):
+    """
+    Records (or updates) ``key`` in the index of media for ``storage``.
+
+    ``updated_at`` defaults to now, since the index is paged through
+    by modification time.
+    """
+    if updated_at is None:
+        updated_at = timezone.now()
+    if sha256 is None:
+        sha256 = _get_sha256_from_key(key)
+    if content_type is None:
+        content_type = mimetypes.guess_type(key)[0] or ""
+    media_item, _ = MediaItem.objects.update_or_create(
+        prefix=get_storage_prefix(storage), key=key, defaults={
+            'size': size,
+            'updated_at': updated_at,
+            'sha256': sha256,
+            'content_type': content_type})
+    return media_item
+
+
+def unindex_media(storage, key):
+    """
+    Removes ``key`` from the index of media for ``storage``.
+    """
+    MediaItem.objects.filter(
+        prefix=get_storage_prefix(storage), key=key).delete()
+
+
+def reconcile_media_catalog(storage):
+    """
+    Updates the index of media for ``storage`` to match the files
+    actually present in ``storage``.
+
+    Returns the number of items created, updated and deleted in the index.
+    """
+    prefix = get_storage_prefix(storage)
+    indexed = {media_item.key: media_item
+        for media_item in MediaItem.objects.filter(prefix=prefix)}
+    created = []
+    updated = []
+    now = timezone.now()
+    for key, size, updated_at in _list_storage_objects(storage):
+        media_item = indexed.pop(key, None)
+        if updated_at is None:
+            # The storage does not know when the file was modified.
+            updated_at = media_item.updated_at if media_item else now
+        if media_item is None:
+            created += [MediaItem(prefix=prefix, key=key, size=size,
+                updated_at=updated_at, sha256=_get_sha256_from_key(key),
+                content_type=mimetypes.guess_type(key)[0] or "")]
+        elif media_item.size != size or media_item.updated_at != updated_at:
+            media_item.size = size
+            media_item.updated_at = updated_at
+            updated += [media_item]
+    with transaction.atomic():
+        MediaItem.objects.bulk_create(created)
+        for media_item in updated:
+            media_item.save(update_fields=['size', 'updated_at'])
+        MediaItem.objects.filter(
+            pk__in=[media_item.pk for media_item in indexed.values()]).delete()
+    _RECONCILED_PREFIXES.add(prefix)
+    LOGGER.info("reconciled media catalog for %s: %d created, %d updated,"\
+        " %d deleted", prefix, len(created), len(updated), len(indexed))
+    return len(created), len(updated), len(indexed)
+
+
+def dedupe_media_tags():
+    """
+    Deletes duplicate (location, tag) rows, which were allowed before
+    ``MediaTag`` was unique on (location, tag).
+
+    Returns the number of rows deleted.
+    """
+    kept = MediaTag.objects.values('location', 'tag').annotate(
+        min_pk=Min('pk')).values_list('min_pk', flat=True)
+    nb_deleted, _ = MediaTag.objects.exclude(pk__in=list(kept)).delete()
+    LOGGER.info("deleted %d duplicate media tags", nb_deleted)
+    return nb_deleted
@@ -28,9 +28,15 @@ from functools import WRAPPER_ASSIGNMENTS
 import re
 
 import six
-from six.moves.urllib.parse import urljoin, urlparse, urlsplit, urlunparse
+from six.moves.urllib.parse import (unquote, urljoin, urlparse, urlsplit,
+    urlunparse)
 from django.core.exceptions import ImproperlyConfigured
 
+try:
+    from asgiref.sync import sync_to_async
+except ImportError: # django < 3.0
+    sync_to_async = None
+
 try:
     from django.utils.decorators import available_attrs
 except ImportError: # django < 3.0
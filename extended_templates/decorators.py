@@ -27,9 +27,8 @@ from functools import wraps
 from django.template.response import TemplateResponse
 
 from .compat import available_attrs
-from .thread_locals import (enable_instrumentation, disable_instrumentation,
-    get_edition_tools_context_data)
-from .views.pages import inject_edition_tools as _inject_edition_tools
+from .thread_locals import get_edition_tools_context_data, instrumentation
+from .views.pages import splice_edition_tools
 
 def inject_edition_tools(function=None):
     """
@@ -38,22 +37,21 @@ def inject_edition_tools(function=None):
     def decorator(view_func):
         @wraps(view_func, assigned=available_attrs(view_func))
         def _wrapped_view(request, *args, **kwargs):
-            enable_instrumentation()
-            response = view_func(request, *args, **kwargs)
-            disable_instrumentation()
+            with instrumentation() as templates:
+                response = view_func(request, *args, **kwargs)
+                if isinstance(response, TemplateResponse):
+                    # We could use ``SingleTemplateResponse`` to catch both
+                    # django and rest_framework responses. Unfortunately
+                    # the content_type on rest_framework responses is set
+                    # very late (render), while at the same time django
+                    # defaults it to text/html until then.
+                    response.render()
             if isinstance(response, TemplateResponse):
-                # We could use ``SingleTemplateResponse`` to catch both
-                # django and rest_framework responses. Unfortunately
-                # the content_type on rest_framework responses is set
-                # very late (render), while at the same time django
-                # defaults it to text/html until then.
-                response.render()
-                soup = _inject_edition_tools(response, request,
-                    context=get_edition_tools_context_data())
-                if soup:
-                    # str(soup) instead of soup.prettify() to avoid
-                    # trailing whitespace on a reformatted HTML textarea
-                    response.content = str(soup)
+                content = splice_edition_tools(response, request,
+                    context=get_edition_tools_context_data(
+                        templates=templates))
+                if content:
+                    response.content = content
             return response
         return _wrapped_view
 
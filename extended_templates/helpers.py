@@ -23,7 +23,57 @@
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 from __future__ import unicode_literals
 
-from .compat import six
+from functools import wraps
+
+from django.db import close_old_connections
+
+from .compat import six, sync_to_async
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Calls the blocking ``func`` in a worker thread, such that the event
+    loop keeps serving other requests while ``func`` waits on I/O.
+    """
+    def _run():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Worker threads are not tied to a request, so database
+            # connections are not cleaned up by request_finished.
+            close_old_connections()
+    return await sync_to_async(_run, thread_sensitive=False)()
+
+
+def as_async_view(view_func):
+    """
+    Returns a coroutine view that calls the synchronous ``view_func``,
+    and renders the response it returns, in a worker thread.
+    """
+    def _get_rendered_response(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        return await run_blocking(
+            _get_rendered_response, request, *args, **kwargs)
+    return _wrapped_view
+
+
+class AsyncViewMixin(object):
+    """
+    Serves a synchronous view from a worker thread when running under ASGI.
+
+    Filesystem access, storage listing and subprocess calls made
+    by the view do not run in the thread shared by all synchronous
+    views, so a slow request does not hold up the others.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return as_async_view(super(AsyncViewMixin, cls).as_view(**initkwargs))
 
 
 def update_context_urls(context, urls):
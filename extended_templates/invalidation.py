@@ -0,0 +1,303 @@
+# Copyright (c) 2026, Djaodjin Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Broadcast of template modifications between processes
+
+When a template is edited, the process which handled the request evicts
+the template from its own caches. The other processes (gunicorn workers,
+other nodes) are notified through an invalidation backend, which they poll
+at the start of each request.
+
+Backends are selected with ``TEMPLATES_INVALIDATION_BACKEND`` and created
+with ``TEMPLATES_INVALIDATION_OPTIONS`` as keyword arguments. By default,
+the file and unix socket backends keep their state in
+``TEMPLATES_INVALIDATION_DIR``, which must not be served publicly (unlike
+``MEDIA_ROOT``).
+
+The receiver polling the backend is connected in ``AppConfig.ready``.
+"""
+
+import json, logging, os, socket, tempfile, uuid
+
+from django.core.cache import caches
+
+from . import settings
+from .compat import import_string
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Event returned by ``poll`` when events were missed. All templates
+# must then be evicted from the caches.
+CLEAR_ALL = (None, None, None)
+
+_BACKEND = None
+
+
+class BaseInvalidationBackend(object):
+    """
+    Publishes and receives (theme_name, template_name, template_path)
+    events.
+    """
+
+    def __init__(self, **kwargs):
+        #pylint:disable=unused-argument
+        self.origin = uuid.uuid4().hex
+        self.pid = os.getpid()
+
+    def _encode(self, theme_name, template_name, template_path):
+        return json.dumps(
+            [self.origin, theme_name, template_name, template_path])
+
+    def _decode(self, data):
+        """
+        Returns an event, or `None` if the event was published by this
+        process.
+        """
+        try:
+            origin, theme_name, template_name, template_path = json.loads(data)
+        except ValueError:
+            LOGGER.warning("invalid template invalidation event: %s", data)
+            return None
+        if origin == self.origin:
+            return None
+        return (theme_name, template_name, template_path)
+
+    def publish(self, theme_name, template_name, template_path=None):
+        raise NotImplementedError()
+
+    def poll(self):
+        """
+        Returns the events published by other processes since
+        the last call.
+        """
+        raise NotImplementedError()
+
+
+class CacheInvalidationBackend(BaseInvalidationBackend):
+    """
+    Stores events in the Django cache *cache_alias*, under a key per
+    generation number. Polling costs a single cache lookup when
+    no template was modified.
+    """
+
+    def __init__(self, cache_alias='default',
+                 key_prefix='extended_templates_invalidation',
+                 max_events=100, timeout=3600, **kwargs):
+        #pylint:disable=too-many-arguments
+        super(CacheInvalidationBackend, self).__init__(**kwargs)
+        self.cache = caches[cache_alias]
+        self.key_prefix = key_prefix
+        self.max_events = max_events
+        self.timeout = timeout
+        self.generation = self.cache.get(self.generation_key, 0)
+
+    @property
+    def generation_key(self):
+        return "%s_generation" % self.key_prefix
+
+    def get_event_key(self, generation):
+        return "%s_%d" % (self.key_prefix, generation)
+
+    def publish(self, theme_name, template_name, template_path=None):
+        self.cache.add(self.generation_key, 0, timeout=None)
+        generation = self.cache.incr(self.generation_key)
+        self.cache.set(self.get_event_key(generation),
+            self._encode(theme_name, template_name, template_path),
+            timeout=self.timeout)
+
+    def poll(self):
+        generation = self.cache.get(self.generation_key, 0)
+        if generation == self.generation:
+            return []
+        start = self.generation
+        self.generation = generation
+        if generation < start or generation - start > self.max_events:
+            return [CLEAR_ALL]
+        keys = [self.get_event_key(idx)
+            for idx in range(start + 1, generation + 1)]
+        found = self.cache.get_many(keys)
+        if len(found) != len(keys):
+            # Some events have expired.
+            return [CLEAR_ALL]
+        events = []
+        for key in keys:
+            event = self._decode(found[key])
+            if event:
+                events += [event]
+        return events
+
+
+class FileInvalidationBackend(BaseInvalidationBackend):
+    """
+    Appends events to the file at *path*, shared by all processes on
+    a host. The size of the file is the generation counter, such that
+    polling costs a single ``stat`` when no template was modified.
+
+    Once the file is larger than *max_size* bytes, the process which
+    appended the last event replaces it with an empty file. Other processes
+    notice the file changed (inode number) and clear all templates from
+    their caches since they might have missed events.
+    """
+
+    def __init__(self, path=None, max_size=1024 * 1024, **kwargs):
+        super(FileInvalidationBackend, self).__init__(**kwargs)
+        if not path:
+            path = os.path.join(
+                settings.TEMPLATES_INVALIDATION_DIR, '.invalidations')
+        self.path = path
+        self.max_size = max_size
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            statinfo = os.stat(self.path)
+            self.inode = statinfo.st_ino
+            self.offset = statinfo.st_size
+        except FileNotFoundError:
+            self.inode = None
+            self.offset = 0
+
+    def publish(self, theme_name, template_name, template_path=None):
+        line = "%s\n" % self._encode(theme_name, template_name, template_path)
+        # Writes in append mode are atomic for such small lines.
+        with open(self.path, 'a') as events_file:
+            events_file.write(line)
+            size = events_file.tell()
+        if size > self.max_size:
+            self._rotate()
+
+    def _rotate(self):
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(self.path),
+                delete=False) as events_file:
+            inode = os.fstat(events_file.fileno()).st_ino
+        os.replace(events_file.name, self.path)
+        LOGGER.info("rotated template invalidations in %s", self.path)
+        # This process has seen all the events it published.
+        self.inode = inode
+        self.offset = 0
+
+    def poll(self):
+        try:
+            statinfo = os.stat(self.path)
+            inode, size = statinfo.st_ino, statinfo.st_size
+        except FileNotFoundError:
+            inode, size = None, 0
+        if self.inode is None:
+            # The file was created since we last looked.
+            self.inode = inode
+        if inode == self.inode and size == self.offset:
+            return []
+        if inode != self.inode or size < self.offset:
+            # The file was truncated or rotated.
+            self.inode = inode
+            self.offset = size
+            return [CLEAR_ALL]
+        with open(self.path, 'rb') as events_file:
+            if os.fstat(events_file.fileno()).st_ino != inode:
+                # The file was rotated since we called `stat`.
+                return self.poll()
+            events_file.seek(self.offset)
+            data = events_file.read(size - self.offset)
+        # Only consumes complete lines.
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        events = []
+        for line in data.decode('utf-8').splitlines():
+            event = self._decode(line)
+            if event:
+                events += [event]
+        return events
+
+
+class UnixSocketInvalidationBackend(BaseInvalidationBackend):
+    """
+    Each process binds a datagram socket in *socket_dir*. Events are sent
+    to every socket in the directory and received without blocking.
+    """
+
+    def __init__(self, socket_dir=None, **kwargs):
+        super(UnixSocketInvalidationBackend, self).__init__(**kwargs)
+        if not socket_dir:
+            socket_dir = os.path.join(
+                settings.TEMPLATES_INVALIDATION_DIR, '.invalidations.d')
+        self.socket_dir = socket_dir
+        if not os.path.isdir(self.socket_dir):
+            os.makedirs(self.socket_dir, exist_ok=True)
+        self.socket_name = "%d.sock" % self.pid
+        self.socket_path = os.path.join(self.socket_dir, self.socket_name)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.socket_path)
+        self.sock.setblocking(False)
+
+    def publish(self, theme_name, template_name, template_path=None):
+        data = self._encode(
+            theme_name, template_name, template_path).encode('utf-8')
+        for socket_name in os.listdir(self.socket_dir):
+            if socket_name == self.socket_name:
+                continue
+            socket_path = os.path.join(self.socket_dir, socket_name)
+            try:
+                self.sock.sendto(data, socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The process is gone.
+                LOGGER.debug("remove stale socket %s", socket_path)
+                try:
+                    os.remove(socket_path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                LOGGER.warning("%s is not reading template invalidations"\
+                    " fast enough.", socket_path)
+
+    def poll(self):
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            event = self._decode(data.decode('utf-8'))
+            if event:
+                events += [event]
+        return events
+
+
+def get_invalidation_backend():
+    """
+    Returns the invalidation backend for the current process, or `None`
+    if ``TEMPLATES_INVALIDATION_BACKEND`` is not set.
+    """
+    #pylint:disable=global-statement
+    global _BACKEND
+    if not settings.TEMPLATES_INVALIDATION_BACKEND:
+        return None
+    # Backends are created after processes are forked (ex: gunicorn
+    # workers) since each process must have its own identity.
+    if _BACKEND is None or _BACKEND.pid != os.getpid():
+        _BACKEND = import_string(settings.TEMPLATES_INVALIDATION_BACKEND)(
+            **settings.TEMPLATES_INVALIDATION_OPTIONS)
+    return _BACKEND
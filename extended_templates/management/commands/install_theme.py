@@ -48,10 +48,19 @@ class Command(BaseCommand):
         parser.add_argument('--path_prefix', action='store',
             dest='path_prefix', default=None,
             help='Adds a prefix to all URLs for static assets')
+        parser.add_argument('--incremental',
+            action='store_true', dest='incremental', default=None,
+            help='only update files that changed since the last install'\
+            ' (requires --force to update an installed theme)')
+        parser.add_argument('--workers', action='store', type=int,
+            dest='workers', default=None,
+            help='number of threads used to validate templates')
         parser.add_argument('packages', nargs='*',
             help='list of theme packages')
 
     def handle(self, *args, **options):
         app_name = options['app_name']
         for package_uri in options['packages']:
-            install_theme(app_name, package_uri, force=options['force'])
+            install_theme(app_name, package_uri, force=options['force'],
+                workers=options['workers'],
+                incremental=options['incremental'])
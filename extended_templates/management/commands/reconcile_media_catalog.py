@@ -0,0 +1,59 @@
+# Copyright (c) 2026, Djaodjin Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand
+
+from ...catalog import dedupe_media_tags, reconcile_media_catalog
+from ...utils import get_account_model, get_default_storage
+
+
+class Command(BaseCommand):
+    """
+    Updates the index of media with the files actually present
+    in the storage of each account.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('accounts', nargs='*',
+            help="slugs of the accounts to reconcile (defaults to all)")
+        parser.add_argument('--dedupe-tags', action='store_true',
+            help="deletes duplicate media tags (once, before adding"\
+            " the unique constraint on existing databases)")
+
+    def handle(self, *args, **options):
+        if options['dedupe_tags']:
+            nb_deleted = dedupe_media_tags()
+            self.stdout.write("%d duplicate media tags deleted\n" % nb_deleted)
+        accounts = get_account_model().objects.all()
+        if options['accounts']:
+            accounts = accounts.filter(slug__in=options['accounts'])
+        else:
+            # Media uploaded outside any account
+            accounts = [None] + list(accounts)
+        for account in accounts:
+            storage = get_default_storage(None, account)
+            nb_created, nb_updated, nb_deleted = reconcile_media_catalog(
+                storage)
+            self.stdout.write("%s: %d created, %d updated, %d deleted\n" % (
+                account, nb_created, nb_updated, nb_deleted))
@@ -62,13 +62,42 @@ class EditTools(models.Model):
 @python_2_unicode_compatible
 class MediaTag(models.Model):
 
-    location = models.CharField(max_length=250)
+    location = models.CharField(max_length=250, db_index=True)
     tag = models.CharField(max_length=50)
 
+    class Meta:
+        unique_together = ('location', 'tag')
+
     def __str__(self):
         return str(self.tag)
 
 
+@python_2_unicode_compatible
+class MediaItem(models.Model):
+    """
+    Index of the media files in a storage, such that listing them does
+    not require to walk the storage and request metadata for each file.
+    """
+    prefix = models.CharField(max_length=250,
+        help_text=_("Identifies the storage (ex: s3://bucket/location)"))
+    key = models.CharField(max_length=250,
+        help_text=_("Name of the file relative to the storage"))
+    size = models.BigIntegerField(null=True,
+        help_text=_("Size of the file in bytes"))
+    updated_at = models.DateTimeField(
+        help_text=_("Last date/time the file content was updated"))
+    sha256 = models.CharField(max_length=64, blank=True,
+        help_text=_("SHA-256 hex digest of the file content"))
+    content_type = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        unique_together = ('prefix', 'key')
+        indexes = [models.Index(fields=['prefix', 'updated_at'])]
+
+    def __str__(self):
+        return '%s/%s' % (self.prefix, self.key)
+
+
 @python_2_unicode_compatible
 class LessVariable(models.Model):
     """
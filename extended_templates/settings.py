@@ -55,8 +55,11 @@ _SETTINGS = {
         settings.BASE_DIR, os.path.basename(settings.BASE_DIR),
         'static', 'scss'),
     'ASSETS_DIRS_CALLABLE': None,
+    'ASSETS_INDEX_REFRESH_INTERVAL': 5,
     'AUTH_USER_MODEL': getattr(settings, 'AUTH_USER_MODEL', None),
     'BUILD_ABSOLUTE_URI_CALLABLE': None,
+    'AWS_S3_COPY_CONCURRENCY': 10,
+    'AWS_S3_COPY_PART_SIZE': 64 * 1024 * 1024,
     'AWS_SERVER_SIDE_ENCRYPTION': "AES256",
     'AWS_STORAGE_BUCKET_NAME':
         getattr(settings, 'AWS_STORAGE_BUCKET_NAME',
@@ -70,6 +73,8 @@ _SETTINGS = {
         'extended_templates.backends.TemplateEmailBackend'),
     'EXTRA_FIELD': None,
     'EXTRA_MIXIN': object,
+    'INSTALL_THEME_INCREMENTAL': False,
+    'INSTALL_THEME_WORKERS': None,
     'MEDIA_PREFIX': '',
     'MEDIA_URL': getattr(settings, 'MEDIA_URL'),
     'MEDIA_ROOT': getattr(settings, 'MEDIA_ROOT'),
@@ -83,9 +88,17 @@ _SETTINGS = {
         os.path.dirname(sys.executable), 'sassc'),
     'SHOW_EDIT_TOOLS': None,
     'STATIC_URL': getattr(settings, 'STATIC_URL', '/static/'),
+    'STORAGE_CACHE_SIZE': 128,
+    'STORAGE_CACHE_TTL': 900,
     'TEMPLATES_BLACKLIST': [],
+    'TEMPLATES_BYTECODE_CACHE_DIR': None,
+    'TEMPLATES_INVALIDATION_BACKEND': None,
+    'TEMPLATES_INVALIDATION_DIR': (settings.RUN_DIR
+        if hasattr(settings, 'RUN_DIR') else settings.BASE_DIR),
+    'TEMPLATES_INVALIDATION_OPTIONS': {},
     'TEMPLATES_WHITELIST': None,
     'THEME_DIR_CALLABLE': theme_dir,
+    'THEME_STORE_ROOT': None,
 }
 _SETTINGS.update(getattr(settings, 'EXTENDED_TEMPLATES', {}))
 
@@ -93,12 +106,16 @@ ACCOUNT_MODEL = _SETTINGS.get('ACCOUNT_MODEL')
 ACCOUNT_URL_KWARG = _SETTINGS.get('ACCOUNT_URL_KWARG')
 ACTIVE_THEME_CALLABLE = _SETTINGS.get('ACTIVE_THEME_CALLABLE')
 APP_NAME = _SETTINGS.get('APP_NAME')
+AWS_S3_COPY_CONCURRENCY = _SETTINGS.get('AWS_S3_COPY_CONCURRENCY')
+AWS_S3_COPY_PART_SIZE = _SETTINGS.get('AWS_S3_COPY_PART_SIZE')
 AWS_SERVER_SIDE_ENCRYPTION = _SETTINGS.get('AWS_SERVER_SIDE_ENCRYPTION')
 AWS_STORAGE_BUCKET_NAME = _SETTINGS.get('AWS_STORAGE_BUCKET_NAME')
 ASSETS_MAP = _SETTINGS.get('ASSETS_MAP')
 ASSETS_CACHE_DIR = _SETTINGS.get('ASSETS_CACHE_DIR')
 ASSETS_SOURCES_DIR = _SETTINGS.get('ASSETS_SOURCES_DIR')
 ASSETS_DIRS_CALLABLE = _SETTINGS.get('ASSETS_DIRS_CALLABLE')
+ASSETS_INDEX_REFRESH_INTERVAL = _SETTINGS.get(
+    'ASSETS_INDEX_REFRESH_INTERVAL')
 AUTH_USER_MODEL = _SETTINGS.get('AUTH_USER_MODEL')
 BUCKET_NAME_FROM_FIELDS = _SETTINGS.get('BUCKET_NAME_FROM_FIELDS')
 BUILD_ABSOLUTE_URI_CALLABLE = _SETTINGS.get('BUILD_ABSOLUTE_URI_CALLABLE')
@@ -109,8 +126,12 @@ EMAILER_BACKEND = _SETTINGS.get('EMAILER_BACKEND')
 PDF_FLATFORM_BIN = _SETTINGS.get('PDF_FLATFORM_BIN')
 SASSC_BIN = _SETTINGS.get('SASSC_BIN')
 STATIC_URL = _SETTINGS.get('STATIC_URL')
+STORAGE_CACHE_SIZE = _SETTINGS.get('STORAGE_CACHE_SIZE')
+STORAGE_CACHE_TTL = _SETTINGS.get('STORAGE_CACHE_TTL')
 EXTRA_FIELD = _SETTINGS.get('EXTRA_FIELD')
 EXTRA_MIXIN = _SETTINGS.get('EXTRA_MIXIN')
+INSTALL_THEME_INCREMENTAL = _SETTINGS.get('INSTALL_THEME_INCREMENTAL')
+INSTALL_THEME_WORKERS = _SETTINGS.get('INSTALL_THEME_WORKERS')
 MEDIA_PREFIX = _SETTINGS.get('MEDIA_PREFIX')
 MEDIA_URL = _SETTINGS.get('MEDIA_URL')
 MEDIA_ROOT = _SETTINGS.get('MEDIA_ROOT')
@@ -118,8 +139,15 @@ PUBLIC_ROOT = _SETTINGS.get('PUBLIC_ROOT')
 PUBLIC_WHITELIST = _SETTINGS.get('PUBLIC_WHITELIST')
 SHOW_EDIT_TOOLS = _SETTINGS.get('SHOW_EDIT_TOOLS')
 TEMPLATES_BLACKLIST = _SETTINGS.get('TEMPLATES_BLACKLIST')
+TEMPLATES_BYTECODE_CACHE_DIR = _SETTINGS.get('TEMPLATES_BYTECODE_CACHE_DIR')
+TEMPLATES_INVALIDATION_BACKEND = _SETTINGS.get(
+    'TEMPLATES_INVALIDATION_BACKEND')
+TEMPLATES_INVALIDATION_DIR = _SETTINGS.get('TEMPLATES_INVALIDATION_DIR')
+TEMPLATES_INVALIDATION_OPTIONS = _SETTINGS.get(
+    'TEMPLATES_INVALIDATION_OPTIONS')
 TEMPLATES_WHITELIST = _SETTINGS.get('TEMPLATES_WHITELIST')
 THEME_DIR_CALLABLE = _SETTINGS.get('THEME_DIR_CALLABLE')
+THEME_STORE_ROOT = _SETTINGS.get('THEME_STORE_ROOT')
 
 LANGUAGE_CODE = getattr(settings, 'LANGUAGE_CODE')
 
@@ -24,28 +24,57 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
-import logging, os, tempfile, shutil, subprocess, sys, zipfile
+import difflib, hashlib, json, logging, os, tempfile, shutil, sys, threading
+import time, zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import jinja2, requests
 from django.conf import settings as django_settings
 from django.core.files.storage import FileSystemStorage
 from django.core.exceptions import PermissionDenied
+from django.core.signals import request_started
+from django.dispatch import receiver
 from django.template.base import Parser, NodeList
-from django.template.backends.jinja2 import get_exception_info
+from django.template.backends.jinja2 import (Jinja2 as Jinja2Templates,
+    get_exception_info)
 from django.template.context import Context
 from django.template.exceptions import TemplateDoesNotExist, TemplateSyntaxError
-from django.template.loader import get_template
+from django.template.loader import _engine_list, get_template
 from django.template.utils import EngineHandler
 from django.utils._os import safe_join
 from rest_framework.exceptions import ValidationError
 
 from . import settings
-from .compat import (TokenType, do_static, force_str, get_html_engine,
-    import_string, six, urlparse)
+from .invalidation import CLEAR_ALL, get_invalidation_backend
+from .compat import (DebugLexer, TokenType, do_static, force_str,
+    get_html_engine, import_string, six, urlparse)
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Name of the file, inside a theme directory, that records the digests
+# of installed files.
+MANIFEST_NAME = '.manifest.json'
+
+# Content digests of files on disk, keyed by path, and invalidated when
+# the file size or modification time changes. This is used to compare
+# templates in a theme package with the ones in the default theme without
+# reading the default theme files over and over again.
+_FILE_DIGESTS = {}
+_FILE_DIGESTS_LOCK = threading.Lock()
+
+# Engines used to check the syntax of templates, keyed on the settings
+# they were created from.
+_VALIDATION_ENGINES = {}
+_VALIDATION_ENGINES_LOCK = threading.Lock()
+
+# Dependency graphs between templates, keyed by theme name.
+_DEPENDENCY_GRAPHS = {}
+_DEPENDENCY_GRAPHS_LOCK = threading.Lock()
+
+# Directives through which a template loads other templates.
+REFERENCE_TAGS = ('extends', 'include', 'import', 'from')
+
 
 class URLRewriteWrapper(object):
 
@@ -112,13 +141,13 @@ class AssetsParser(Parser):
                 pass
 
 
-def check_template(template_source, using=None):
+def _get_validation_engine():
     """
-    Loads and returns a template for the given name.
+    Returns the Jinja2 engine used to check the syntax of templates.
 
-    Raises TemplateDoesNotExist if no such template exists.
+    Engines are built once and cached, keyed on the definition
+    of the 'html' engine in ``django_settings.TEMPLATES``.
     """
-    errs = None
     found = None
     for engine in django_settings.TEMPLATES:
         engine_name = engine.get('NAME')
@@ -133,31 +162,351 @@ def check_template(template_source, using=None):
             'BACKEND': 'django.template.backends.jinja2.Jinja2',
             'DIRS': django_settings.TEMPLATES_DIRS,
         }
-    engines_handler = EngineHandler(templates=[found])
-    engines = [engines_handler['html']]
-
-    # Jinja2's engine `from_string` will not just check the template
-    # source code, but will also go through loading the `extends` and `include`
-    # templates, using the search path in the loader defined in
-    # `django_settings.TEMPLATES`. That's a problem, though it might only
-    # be happening when `DEBUG=0`. I couldn't reproduce the error, even
-    # with missing template files.
-
-    # We should find at least one engine that does not raise an error.
-    for engine in engines:
+    key = repr(found)
+    engine = _VALIDATION_ENGINES.get(key)
+    if engine is None:
+        with _VALIDATION_ENGINES_LOCK:
+            engine = _VALIDATION_ENGINES.get(key)
+            if engine is None:
+                engines_handler = EngineHandler(templates=[found])
+                engine = engines_handler['html']
+                _VALIDATION_ENGINES[key] = engine
+    return engine
+
+
+def check_template(template_source, using=None):
+    """
+    Checks the syntax of a template and returns its parsed
+    (``jinja2.nodes.Template``) representation.
+
+    Templates are only parsed, hence ``extends``, ``include`` and
+    ``import`` directives are not resolved.
+
+    Raises TemplateSyntaxError if the template is invalid.
+    """
+    #pylint:disable=unused-argument
+    engine = _get_validation_engine()
+    try:
+        return engine.env.parse(template_source)
+    except jinja2.TemplateSyntaxError as exc:
+        new = TemplateSyntaxError(exc.args)
+        new.template_debug = get_exception_info(exc)
+        six.reraise(TemplateSyntaxError, new, sys.exc_info()[2])
+    return None
+
+
+def check_templates(template_sources, using=None):
+    """
+    Checks the syntax of many templates at once.
+
+    *template_sources* is a dictionary, or an iterable of pairs, of
+    template names and source code. Returns a dictionary of template names
+    to the ``TemplateSyntaxError`` raised for each invalid template.
+    """
+    if hasattr(template_sources, 'items'):
+        template_sources = six.iteritems(template_sources)
+    errors = {}
+    for template_name, template_source in template_sources:
         try:
-            try:
-                return engine.from_string(template_source)
-            except jinja2.TemplateSyntaxError as exc:
-                new = TemplateSyntaxError(exc.args)
-                new.template_debug = get_exception_info(exc)
-                six.reraise(TemplateSyntaxError, new, sys.exc_info()[2])
+            check_template(template_source, using=using)
         except TemplateSyntaxError as err:
-            # We rely on the last engine being the 'html' engine.
-            errs = err
-    if errs:
-        raise errs
-    return None
+            errors[template_name] = err
+    return errors
+
+
+def _compute_file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as content_file:
+        for chunk in iter(lambda: content_file.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_digest(path):
+    """
+    Returns the SHA-256 hex digest of the file at *path*.
+
+    Digests are cached until the size or modification time of the file
+    changes.
+    """
+    statinfo = os.stat(path)
+    key = (statinfo.st_size, statinfo.st_mtime_ns)
+    cached = _FILE_DIGESTS.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    digest = _compute_file_digest(path)
+    with _FILE_DIGESTS_LOCK:
+        _FILE_DIGESTS[path] = (key, digest)
+    return digest
+
+
+def is_same_content(path, content):
+    """
+    Returns `True` if the file at *path* contains exactly *content* (bytes).
+
+    Sizes are compared first so that most modified files are detected
+    without computing any hash.
+    """
+    try:
+        if os.path.getsize(path) != len(content):
+            return False
+    except OSError:
+        return False
+    return get_file_digest(path) == hashlib.sha256(content).hexdigest()
+
+
+def unified_diff(from_path, to_path):
+    """
+    Returns the lines of a unified diff between files *from_path*
+    and *to_path*, in the style of ``diff -u``.
+    """
+    with open(from_path) as from_file:
+        from_lines = from_file.readlines()
+    with open(to_path) as to_file:
+        to_lines = to_file.readlines()
+    return list(difflib.unified_diff(
+        from_lines, to_lines, fromfile=from_path, tofile=to_path))
+
+
+def get_bytecode_cache():
+    """
+    Returns a Jinja2 bytecode cache stored in
+    ``settings.TEMPLATES_BYTECODE_CACHE_DIR``, or `None` when no directory
+    is configured.
+
+    Compiled templates are keyed by template name and path, and checked
+    against a hash of the template source, so they stay valid across
+    process restarts and are recompiled only when a template is edited.
+    Pass the result as the ``bytecode_cache`` option of the Jinja2
+    environment.
+    """
+    cache_dir = settings.TEMPLATES_BYTECODE_CACHE_DIR
+    if not cache_dir:
+        return None
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    return jinja2.FileSystemBytecodeCache(directory=cache_dir)
+
+
+def get_template_references(template_string, template_path=None):
+    """
+    Returns the names of the templates loaded by *template_string*
+    through ``extends``, ``include``, ``import`` and ``from`` directives.
+
+    Template names computed at render time cannot be found
+    and are ignored.
+    """
+    references = []
+    engine, _, _ = get_html_engine()
+    if isinstance(engine, Jinja2Templates):
+        state = None
+        for _, token_type, token_value in engine.env.lexer.tokeniter(
+                template_string, None, filename=template_path):
+            if token_type == 'whitespace':
+                continue
+            if token_type == 'block_begin':
+                state = 'directive'
+            elif token_type == 'block_end':
+                state = None
+            elif state == 'directive':
+                state = ('reference' if (token_type == 'name' and
+                    token_value in REFERENCE_TAGS) else None)
+            elif state == 'reference' and token_type == 'string':
+                references += [token_value[1:-1]]
+    else:
+        # DjangoTemplates
+        for token in DebugLexer(template_string).tokenize():
+            if token.token_type == TokenType.BLOCK:
+                bits = token.split_contents()
+                if (len(bits) > 1 and bits[0] in REFERENCE_TAGS and
+                    bits[1][0] in ('"', "'") and bits[1][0] == bits[1][-1]):
+                    references += [bits[1][1:-1]]
+    return references
+
+
+class TemplateDependencyGraph(object):
+    """
+    Edges between templates created by ``extends``, ``include``,
+    ``import`` and ``from`` directives.
+    """
+
+    def __init__(self):
+        self.dependencies = {}
+        self.dependents = {}
+        self.lock = threading.Lock()
+
+    def update_template(self, template_name, template_string,
+                        template_path=None):
+        """
+        Updates the edges from *template_name* after its source
+        changed to *template_string*.
+        """
+        references = set(get_template_references(
+            template_string, template_path=template_path))
+        with self.lock:
+            for name in (self.dependencies.get(template_name, set())
+                         - references):
+                self.dependents.get(name, set()).discard(template_name)
+            for name in references:
+                self.dependents.setdefault(name, set()).add(template_name)
+            self.dependencies[template_name] = references
+
+    def get_dependencies(self, template_name):
+        """
+        Returns the templates directly loaded by *template_name*.
+        """
+        return sorted(self.dependencies.get(template_name, []))
+
+    def get_dependents(self, template_name):
+        """
+        Returns the templates which load *template_name*, directly
+        or transitively.
+        """
+        dependents = set()
+        with self.lock:
+            candidates = list(self.dependents.get(template_name, []))
+            while candidates:
+                name = candidates.pop()
+                if name not in dependents and name != template_name:
+                    dependents.add(name)
+                    candidates += list(self.dependents.get(name, []))
+        return sorted(dependents)
+
+
+def _get_template_dirs(theme_name):
+    engine, _, _ = get_html_engine()
+    template_dirs = [safe_join(get_theme_dir(theme_name), 'templates')]
+    template_dirs += list(getattr(engine, 'template_dirs',
+        getattr(engine, 'dirs', [])))
+    return template_dirs
+
+
+def get_dependency_graph(theme_name):
+    """
+    Returns the ``TemplateDependencyGraph`` between templates visible
+    from *theme_name*, building it on first access.
+
+    Templates in the theme override templates with the same name
+    in the default search path.
+    """
+    graph = _DEPENDENCY_GRAPHS.get(theme_name)
+    if graph is not None:
+        return graph
+    graph = TemplateDependencyGraph()
+    for template_dir in _get_template_dirs(theme_name):
+        for dirpath, _, filenames in os.walk(template_dir):
+            for filename in filenames:
+                template_path = os.path.join(dirpath, filename)
+                template_name = os.path.relpath(
+                    template_path, template_dir).replace(os.sep, '/')
+                if template_name in graph.dependencies:
+                    continue
+                try:
+                    with open(template_path) as template_file:
+                        graph.update_template(template_name,
+                            template_file.read(), template_path=template_path)
+                except (OSError, UnicodeDecodeError,
+                        jinja2.TemplateSyntaxError, TemplateSyntaxError):
+                    LOGGER.debug("cannot find dependencies of %s",
+                        template_path)
+    with _DEPENDENCY_GRAPHS_LOCK:
+        graph = _DEPENDENCY_GRAPHS.setdefault(theme_name, graph)
+    return graph
+
+
+def clear_template_cache(template_name=None, theme_name=None):
+    """
+    Evicts compiled *template_name* from the in-memory cache of all
+    Jinja2 engines, or all compiled templates when *template_name*
+    is `None`.
+
+    When *theme_name* is specified, templates which extend, include
+    or import *template_name* in that theme are evicted as well.
+    """
+    template_names = set([template_name])
+    if template_name and theme_name:
+        template_names |= set(
+            get_dependency_graph(theme_name).get_dependents(template_name))
+    for engine in _engine_list(using=None):
+        try:
+            cache = engine.env.cache
+        except AttributeError:
+            continue
+        if cache is None:
+            continue
+        if template_name is None:
+            cache.clear()
+            continue
+        # Jinja2 keys compiled templates by (weakref to loader, name).
+        for key in list(cache.keys()):
+            if key[1] in template_names:
+                try:
+                    del cache[key]
+                except KeyError:
+                    pass
+
+
+def invalidate_template(theme_name, template_name, template_source=None,
+                        template_path=None):
+    """
+    Updates the dependency graph of *theme_name* after *template_name*
+    was modified, then evicts the template and its dependents from
+    the template caches.
+    """
+    if template_source is not None:
+        get_dependency_graph(theme_name).update_template(
+            template_name, template_source, template_path=template_path)
+    clear_template_cache(template_name, theme_name=theme_name)
+    backend = get_invalidation_backend()
+    if backend:
+        backend.publish(theme_name, template_name, template_path=template_path)
+
+
+def invalidate_theme(theme_name):
+    """
+    Evicts all templates from the template caches after *theme_name*
+    was installed or removed.
+    """
+    _DEPENDENCY_GRAPHS.pop(theme_name, None)
+    clear_template_cache()
+    backend = get_invalidation_backend()
+    if backend:
+        backend.publish(theme_name, None)
+
+
+@receiver(request_started, dispatch_uid="extended_templates_invalidations")
+def _process_invalidations(sender, **kwargs):
+    """
+    Evicts from the caches templates which were modified by other processes.
+    """
+    #pylint:disable=unused-argument
+    backend = get_invalidation_backend()
+    if not backend:
+        return
+    for event in backend.poll():
+        if event == CLEAR_ALL:
+            LOGGER.info("missed template invalidations, clears all caches")
+            _DEPENDENCY_GRAPHS.clear()
+            clear_template_cache()
+            continue
+        theme_name, template_name, template_path = event
+        if template_name is None:
+            LOGGER.debug("%s was installed by another process", theme_name)
+            _DEPENDENCY_GRAPHS.pop(theme_name, None)
+            clear_template_cache()
+            continue
+        LOGGER.debug("%s was modified in %s by another process",
+            template_name, theme_name)
+        graph = _DEPENDENCY_GRAPHS.get(theme_name)
+        if graph is not None and template_path:
+            try:
+                with open(template_path) as template_file:
+                    graph.update_template(template_name, template_file.read(),
+                        template_path=template_path)
+            except (OSError, UnicodeDecodeError,
+                    jinja2.TemplateSyntaxError, TemplateSyntaxError):
+                _DEPENDENCY_GRAPHS.pop(theme_name, None)
+        clear_template_cache(template_name, theme_name=theme_name)
 
 
 def get_template_path(template=None, relative_path=None):
@@ -177,7 +526,8 @@ def get_theme_dir(theme_name):
     return theme_dir
 
 
-def install_theme(app_name, package_uri, force=False):
+def install_theme(app_name, package_uri, force=False, workers=None,
+                  incremental=None):
     parts = urlparse(package_uri)
     basename = os.path.basename(parts.path)
     package_file = None
@@ -206,21 +556,357 @@ def install_theme(app_name, package_uri, force=False):
             app_name = os.path.splitext(basename)[0]
         LOGGER.info("install %s to %s\n", package_uri, app_name)
         with zipfile.ZipFile(package_file, 'r') as zip_file:
-            install_theme_fileobj(app_name, zip_file, force=force)
+            install_theme_fileobj(app_name, zip_file, force=force,
+                workers=workers, incremental=incremental)
     finally:
         if hasattr(package_file, 'close'):
             package_file.close()
 
 
-def install_theme_fileobj(theme_name, zip_file, force=False):
+def _get_member_path(info, tmp_dir):
+    """
+    Returns a tuple (base, relative_path, tmp_path) for a member
+    of a theme package, or `None` if the member should not be installed.
+    """
+    if info.file_size == 0:
+        # Crude way to detect directories
+        return None
+    if (info.filename.endswith('.DS_Store') or
+        info.filename.endswith('~')):
+        # skips over files that shouldn't be in the package
+        # but often are.
+        return None
+    test_parts = os.path.normpath(info.filename).split(os.sep)[1:]
+    if not test_parts:
+        return None
+    base = test_parts.pop(0)
+    if not test_parts:
+        return None
+    relative_path = os.path.join(*test_parts)
+    if base == 'public':
+        if (settings.PUBLIC_WHITELIST is not None and
+            relative_path not in settings.PUBLIC_WHITELIST):
+            return None
+    elif base == 'templates':
+        if relative_path in settings.TEMPLATES_BLACKLIST:
+            return None
+        if (settings.TEMPLATES_WHITELIST is not None and
+            relative_path not in settings.TEMPLATES_WHITELIST):
+            return None
+    else:
+        return None
+    return base, relative_path, safe_join(tmp_dir, base, relative_path)
+
+
+def _install_template_member(filename, relative_path, template_bytes,
+                             tmp_path, theme_dir):
+    """
+    Checks the syntax of a template extracted from a theme package and
+    writes it to *tmp_path* unless it is identical to the default theme.
+
+    Returns an error message when the template syntax is incorrect,
+    `None` otherwise.
+    """
+    try:
+        template_string = template_bytes.decode('utf-8')
+    except UnicodeDecodeError as err:
+        LOGGER.info("error:%s: %s", filename, err)
+        raise ValidationError({
+            'detail': "%(relative_path)s: %(err)s" % {
+                'relative_path': filename,
+                'err': err
+            }})
+    template_string = force_str(template_string)
+    try:
+        check_template(template_string)
+    except TemplateSyntaxError as err:
+        LOGGER.info("error:%s: %s", filename, err)
+        return "%(relative_path)s: %(err)s" % {
+            'relative_path': filename, 'err': err}
+    try:
+        default_path = get_template_path(relative_path=relative_path)
+        if (default_path and not default_path.startswith(theme_dir) and
+            is_same_content(default_path, template_bytes)):
+            LOGGER.info("%s: no differences", relative_path)
+            return None
+    except TemplateDoesNotExist:
+        # We are installing a template which is not in the default theme,
+        # so no diff is ok.
+        pass
+    with open(tmp_path, 'wb') as extracted_file:
+        extracted_file.write(template_bytes)
+    return None
+
+
+def _get_member_dest(base, relative_path, templates_dir, public_dir):
+    if base == 'templates':
+        return safe_join(templates_dir, relative_path)
+    return safe_join(public_dir, relative_path)
+
+
+def _get_installed_stat(path):
+    try:
+        statinfo = os.stat(path)
+        return [statinfo.st_size, statinfo.st_mtime_ns]
+    except OSError:
+        return None
+
+
+def _read_manifest(theme_dir):
+    manifest_path = safe_join(theme_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(theme_dir, manifest):
+    with tempfile.NamedTemporaryFile(
+            mode='w+t', dir=theme_dir, delete=False) as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_file.name, safe_join(theme_dir, MANIFEST_NAME))
+
+
+def _extract_members(theme_name, zip_file, members, theme_dir, workers=None):
+    """
+    Extracts *members* (tuples of ``ZipInfo``, base, relative_path
+    and tmp_path) of a theme package. Public assets are copied by chunks
+    from the archive to disk. Templates are small and must be validated,
+    so they are read in memory and handed over to *workers* threads.
+
+    Raises ValidationError if any template is invalid.
+    """
+    #pylint:disable=too-many-locals
+    errs = []
+    executor = None
+    if workers is None or workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        started_at = time.monotonic()
+        nb_public = 0
+        futures = []
+        for info, base, relative_path, tmp_path in members:
+            if not os.path.isdir(os.path.dirname(tmp_path)):
+                os.makedirs(os.path.dirname(tmp_path))
+            if base == 'public':
+                with zip_file.open(info) as member_file:
+                    with open(tmp_path, 'wb') as extracted_file:
+                        shutil.copyfileobj(member_file, extracted_file)
+                nb_public += 1
+            else:
+                args = (info.filename, relative_path,
+                    zip_file.read(info), tmp_path, theme_dir)
+                if executor:
+                    futures += [executor.submit(
+                        _install_template_member, *args)]
+                else:
+                    err = _install_template_member(*args)
+                    if err:
+                        errs += [err]
+        extracted_at = time.monotonic()
+        LOGGER.info("install theme %s: extracted %d public assets"\
+            " in %.3fs", theme_name, nb_public, extracted_at - started_at)
+
+        # Wait for all workers to complete.
+        for future in futures:
+            err = future.result()
+            if err:
+                errs += [err]
+        LOGGER.info("install theme %s: validated %d templates"\
+            " with %s workers in %.3fs", theme_name,
+            len(members) - nb_public, workers if executor else 1,
+            time.monotonic() - extracted_at)
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+    if errs:
+        raise ValidationError({'detail': errs})
+
+    if settings.THEME_STORE_ROOT:
+        started_at = time.monotonic()
+        for _, _, _, tmp_path in members:
+            if os.path.exists(tmp_path):
+                _link_to_store(tmp_path)
+        LOGGER.info("install theme %s: linked files to store in %.3fs",
+            theme_name, time.monotonic() - started_at)
+
+
+def _get_store_path(digest):
+    return safe_join(settings.THEME_STORE_ROOT, digest[:2], digest)
+
+
+def _link_to_store(path):
+    """
+    Replaces the file at *path* by a hard link to a file with the same
+    content in ``settings.THEME_STORE_ROOT``, adding it to the store
+    when it is not already present.
+
+    Files in the store are shared between themes, and thus made read-only
+    such that they cannot inadvertently be modified in place.
+    """
+    store_path = _get_store_path(_compute_file_digest(path))
+    link_path = "%s.link" % path
+    try:
+        os.link(store_path, link_path)
+    except FileNotFoundError:
+        # The content is not in the store, either because it was never
+        # added or because `prune_theme_store` removed it since. We add
+        # *path* itself as the stored copy.
+        if not os.path.isdir(os.path.dirname(store_path)):
+            os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        os.chmod(path, 0o444)
+        try:
+            os.link(path, store_path)
+        except FileExistsError:
+            # Another install stored the same content concurrently.
+            _link_to_store(path)
+        return
+    # Once linked, the store entry has more than one link and is left
+    # alone by `prune_theme_store`.
+    os.replace(link_path, path)
+
+
+def prune_theme_store():
+    """
+    Removes files in ``settings.THEME_STORE_ROOT`` that are not linked
+    from any theme anymore. Returns the number of files removed.
+    """
+    nb_removed = 0
+    if not settings.THEME_STORE_ROOT:
+        return nb_removed
+    for dirpath, _, filenames in os.walk(settings.THEME_STORE_ROOT):
+        for filename in filenames:
+            store_path = os.path.join(dirpath, filename)
+            if os.stat(store_path).st_nlink <= 1:
+                LOGGER.debug("remove unreferenced %s", store_path)
+                os.remove(store_path)
+                nb_removed += 1
+    return nb_removed
+
+
+def _install_theme_delta(theme_name, zip_file, members, manifest,
+                         theme_dir, templates_dir, public_dir, tmp_dir,
+                         workers=None):
+    """
+    Extracts, validates and installs only the *members* whose CRC or size
+    differ from the ones recorded in *manifest*, or whose installed copy
+    was modified since. Files recorded in *manifest* which are not present
+    in the package anymore are removed.
+
+    Nothing is modified until all changed templates have been validated.
+    The templates (resp. public) directory is then staged in *tmp_dir*,
+    with hard links to the unchanged files, and swapped with the installed
+    one. There is no portable way to exchange two directories atomically,
+    so the swap is done with two renames, during which the directory
+    does not exist, instead of one rename per file.
+
+    Returns the manifest for the newly installed theme.
+    """
+    #pylint:disable=too-many-arguments,too-many-locals
+    entries = {}
+    changed = []
+    for member in members:
+        info, base, relative_path, _ = member
+        key = '/'.join([base, relative_path])
+        entry = manifest.get(key)
+        if (entry and entry.get('crc') == info.CRC and
+            entry.get('size') == info.file_size and
+            entry.get('installed') == _get_installed_stat(_get_member_dest(
+                base, relative_path, templates_dir, public_dir))):
+            entries[key] = entry
+        else:
+            changed += [member]
+    changed_keys = set(['/'.join([base, relative_path])
+        for _, base, relative_path, _ in changed])
+    removed = [key for key in manifest
+        if key not in entries and key not in changed_keys]
+    LOGGER.info("install theme %s: %d changed files out of %d",
+        theme_name, len(changed), len(members))
+
+    _extract_members(theme_name, zip_file, changed, theme_dir,
+        workers=workers)
+
+    started_at = time.monotonic()
+    staged_templates = safe_join(tmp_dir, 'staged', 'templates')
+    staged_public = safe_join(tmp_dir, 'staged', 'public')
+    bases = set([member[1] for member in changed] +
+        [key.split('/', 1)[0] for key in removed])
+    swaps = []
+    for base, staged_dir, dest_dir in [
+            ('templates', staged_templates, templates_dir),
+            ('public', staged_public, public_dir)]:
+        if base not in bases:
+            continue
+        if os.path.isdir(dest_dir):
+            shutil.copytree(dest_dir, staged_dir, symlinks=True,
+                copy_function=os.link)
+        else:
+            os.makedirs(staged_dir)
+        swaps += [(staged_dir, dest_dir)]
+    for info, base, relative_path, tmp_path in changed:
+        staged_path = _get_member_dest(
+            base, relative_path, staged_templates, staged_public)
+        if os.path.exists(tmp_path):
+            if not os.path.isdir(os.path.dirname(staged_path)):
+                os.makedirs(os.path.dirname(staged_path))
+            os.replace(tmp_path, staged_path)
+        elif os.path.exists(staged_path):
+            # The template is identical to the one in the default theme.
+            os.remove(staged_path)
+    for key in removed:
+        base, relative_path = key.split('/', 1)
+        staged_path = _get_member_dest(
+            base, relative_path, staged_templates, staged_public)
+        if os.path.exists(staged_path):
+            LOGGER.info("remove previous path %s", _get_member_dest(
+                base, relative_path, templates_dir, public_dir))
+            os.remove(staged_path)
+    for staged_dir, dest_dir in swaps:
+        if os.path.exists(dest_dir):
+            os.rename(dest_dir, "%s.previous" % staged_dir)
+        elif not os.path.isdir(os.path.dirname(dest_dir)):
+            os.makedirs(os.path.dirname(dest_dir))
+        os.rename(staged_dir, dest_dir)
+    for info, base, relative_path, _ in changed:
+        entries['/'.join([base, relative_path])] = {
+            'crc': info.CRC, 'size': info.file_size,
+            'installed': _get_installed_stat(_get_member_dest(
+                base, relative_path, templates_dir, public_dir))}
+    LOGGER.info("install theme %s: updated %d and removed %d files"\
+        " in %.3fs", theme_name, len(changed), len(removed),
+        time.monotonic() - started_at)
+    return entries
+
+
+def install_theme_fileobj(theme_name, zip_file, force=False, workers=None,
+                          incremental=None):
     """
     Extract resources and templates from an opened ``ZipFile``
     and install them at a place they can be picked by the multitier
     logic in ``template_loader.Loader.get_template_sources``.
+
+    Public assets are streamed to disk while templates are checked
+    for syntax errors by a pool of *workers* threads (defaults to
+    ``settings.INSTALL_THEME_WORKERS``).
+
+    When ``settings.THEME_STORE_ROOT`` is defined, installed files are
+    hard links to a single copy of each content in that directory,
+    which must be on the same filesystem as the theme directories.
+
+    When *incremental* is `True` (defaults to
+    ``settings.INSTALL_THEME_INCREMENTAL``) and the theme was previously
+    installed, only the files that changed since are updated. As for
+    a full install, overwriting a previously installed theme requires
+    *force* to be `True`.
     """
-    #pylint:disable=too-many-statements,too-many-locals
+    #pylint:disable=too-many-statements,too-many-locals,too-many-arguments
     assert theme_name is not None
     LOGGER.info("install theme %s%s", theme_name, " (force)" if force else "")
+    if workers is None:
+        workers = settings.INSTALL_THEME_WORKERS
+    if incremental is None:
+        incremental = settings.INSTALL_THEME_INCREMENTAL
     theme_dir = get_theme_dir(theme_name)
     public_dir = safe_join(settings.PUBLIC_ROOT, theme_name)
     templates_dir = safe_join(theme_dir, 'templates')
@@ -250,99 +936,31 @@ def install_theme_fileobj(theme_name, zip_file, force=False):
         os.makedirs(os.path.dirname(templates_dir))
     tmp_dir = tempfile.mkdtemp(dir=tmp_base)
 
-    #pylint: disable=too-many-nested-blocks
-    errs = []
     try:
+        members = []
         for info in zip_file.infolist():
-            if info.file_size == 0:
-                # Crude way to detect directories
-                continue
-            if (info.filename.endswith('.DS_Store') or
-                info.filename.endswith('~')):
-                # skips over files that shouldn't be in the package
-                # but often are.
-                continue
-            tmp_path = None
-            test_parts = os.path.normpath(info.filename).split(os.sep)[1:]
-            if test_parts:
-                base = test_parts.pop(0)
-                if base == 'public':
-                    if settings.PUBLIC_WHITELIST is not None:
-                        if (os.path.join(*test_parts)
-                            in settings.PUBLIC_WHITELIST):
-                            tmp_path = safe_join(tmp_dir, base, *test_parts)
-                    else:
-                        tmp_path = safe_join(tmp_dir, base, *test_parts)
-                    if tmp_path:
-                        if not os.path.isdir(os.path.dirname(tmp_path)):
-                            os.makedirs(os.path.dirname(tmp_path))
-                        with open(tmp_path, 'wb') as extracted_file:
-                            extracted_file.write(zip_file.read(info.filename))
-                elif base == 'templates':
-                    relative_path = os.path.join(*test_parts)
-                    if relative_path in settings.TEMPLATES_BLACKLIST:
-                        continue
-                    if settings.TEMPLATES_WHITELIST is not None:
-                        if (os.path.join(*test_parts)
-                            in settings.TEMPLATES_WHITELIST):
-                            tmp_path = safe_join(tmp_dir, base, relative_path)
-                    else:
-                        tmp_path = safe_join(tmp_dir, base, relative_path)
-                    if tmp_path:
-                        if not os.path.isdir(os.path.dirname(tmp_path)):
-                            os.makedirs(os.path.dirname(tmp_path))
-                        template_bytes = zip_file.read(info.filename)
-                        try:
-                            if hasattr(template_bytes, 'decode'):
-                                template_string = template_bytes.decode('utf-8')
-                            else:
-                                template_string = template_bytes
-                        except UnicodeDecodeError as err:
-                            LOGGER.info("error:%s: %s", info.filename, err)
-                            raise ValidationError({
-                                'detail': "%(relative_path)s: %(err)s" % {
-                                    'relative_path': info.filename,
-                                    'err': err
-                                }})
-                        template_string = force_str(template_string)
-                        try:
-                            check_template(template_string)
-                            with open(tmp_path, 'wb') as extracted_file:
-                                extracted_file.write(template_bytes)
-                            try:
-                                default_path = get_template_path(
-                                    relative_path=relative_path)
-                                if (default_path and
-                                    not default_path.startswith(theme_dir)):
-                                    cmdline = [
-                                        'diff', '-u', default_path, tmp_path]
-                                    with subprocess.Popen(
-                                        cmdline, stdout=subprocess.PIPE) as cmd:
-                                        lines = cmd.stdout.readlines()
-                                        cmd.wait()
-                                    # Non-zero error codes are ok here.
-                                    # That's how diff indicates the files
-                                    # are different.
-                                    if not lines:
-                                        LOGGER.info(
-                                            "%s: no differences", relative_path)
-                                        os.remove(tmp_path)
-                            except TemplateDoesNotExist:
-                                # We are installing a template which is not
-                                # in the default theme, so no diff is ok.
-                                pass
-                        except TemplateSyntaxError as err:
-                            LOGGER.info("error:%s: %s", info.filename, err)
-                            errs += [{"%(relative_path)s: %(err)s" % {
-                                    'relative_path': info.filename,
-                                    'err': err
-                                }}]
-        if errs:
-            raise ValidationError({'detail': errs})
+            member_path = _get_member_path(info, tmp_dir)
+            if member_path:
+                members += [(info,) + member_path]
+
+        manifest = None
+        if incremental and os.path.isdir(templates_dir):
+            manifest = _read_manifest(theme_dir)
+        if manifest is not None:
+            manifest = _install_theme_delta(theme_name, zip_file, members,
+                manifest, theme_dir, templates_dir, public_dir, tmp_dir,
+                workers=workers)
+            _write_manifest(theme_dir, manifest)
+            return
+
+        _extract_members(theme_name, zip_file, members, theme_dir,
+            workers=workers)
 
         # Should be safe to move in-place at this point.
         # Templates are necessary while public resources (css, js)
         # are optional.
+        started_at = time.monotonic()
+        public_root = public_dir
         tmp_public = safe_join(tmp_dir, 'public')
         tmp_templates = safe_join(tmp_dir, 'templates')
         public_paths = []
@@ -372,7 +990,22 @@ def install_theme_fileobj(theme_name, zip_file, force=False):
                 LOGGER.info("remove previous path %s", paths[1])
                 shutil.rmtree(paths[1])
             os.rename(paths[0], paths[1])
+        LOGGER.info("install theme %s: moved in place in %.3fs",
+            theme_name, time.monotonic() - started_at)
+
+        if os.path.isdir(theme_dir):
+            # Records what was installed such that later installs
+            # can be incremental.
+            manifest = {}
+            for info, base, relative_path, _ in members:
+                manifest['/'.join([base, relative_path])] = {
+                    'crc': info.CRC, 'size': info.file_size,
+                    'installed': _get_installed_stat(_get_member_dest(
+                        base, relative_path, templates_dir, public_root))}
+            _write_manifest(theme_dir, manifest)
     finally:
+        # Templates might have changed.
+        invalidate_theme(theme_name)
         # Always delete the temporary directory, exception raised or not.
         shutil.rmtree(tmp_dir)
 
@@ -400,3 +1033,4 @@ def remove_theme(theme_name):
         shutil.rmtree(public_dir)
     except FileNotFoundError:
         pass
+    invalidate_theme(theme_name)
@@ -22,83 +22,187 @@
 # OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-import copy, json, logging
+import builtins, contextvars, json, logging
 from collections import OrderedDict
+from contextlib import contextmanager
 
 from django.dispatch import receiver
 from django.template import loader, Template
 from django.template.backends.django import DjangoTemplates
 from django.test.signals import template_rendered
-from django.test.utils import instrumented_test_render
 
 from . import settings
 from .compat import six
 from .signals import template_loaded
 
-try:
-    from threading import local
-except ImportError:
-    #pylint: disable=import-error,no-name-in-module
-    from django.utils._threading_local import local
-
-_thread_locals = local() #pylint: disable=invalid-name
+# Templates loaded and rendered while serving the current request, or `None`
+# when instrumentation is disabled. A `ContextVar` (rather than a thread local)
+# keeps concurrent requests served on the same thread, as under ASGI, apart.
+_RECORDED_TEMPLATES = contextvars.ContextVar(
+    'extended_templates_recorded_templates', default=None)
 
 LOGGER = logging.getLogger(__name__)
 
 
+def _instrumented_render(self, context):
+    """
+    Sends ``template_rendered`` before rendering a Django template,
+    but only while instrumentation is enabled for the current request.
+    """
+    if _RECORDED_TEMPLATES.get() is not None:
+        template_rendered.send(sender=self, template=self, context=context)
+    return self.original_render(context)
+
+
 # signals hook for Django Templates. Jinja2 templates are done through
 # a custom Environment.
 #pylint:disable=protected-access
 for engine in loader._engine_list():
     if isinstance(engine, DjangoTemplates):
         #pylint:disable=comparison-with-callable
-        if Template._render != instrumented_test_render:
+        if Template._render != _instrumented_render:
             Template.original_render = Template._render
-            Template._render = instrumented_test_render
+            Template._render = _instrumented_render
             break
 
+class EditableStyle(object):
+    """
+    Immutable description of a style variable that can be edited.
+    """
+    __slots__ = ('property', 'default', 'editor')
+
+    def __init__(self, property, default='', editor=None):
+        #pylint:disable=redefined-builtin
+        self.property = property
+        self.default = default
+        self.editor = editor
+
+    @property
+    def value(self):
+        return self.default
+
+    def __repr__(self):
+        return "%s=%s" % (self.property, self.value)
+
+
+class EditableStyleValue(object):
+    """
+    Overlays the value of a style variable for an account on top
+    of the shared ``EditableStyle``.
+    """
+    __slots__ = ('style', 'value')
+
+    def __init__(self, style, value):
+        self.style = style
+        self.value = value
+
+    # Templates access the name of the style variable as `property`,
+    # which shadows the builtin in the class body, hence `builtins.property`.
+    @builtins.property
+    def default(self):
+        return self.style.default
+
+    @builtins.property
+    def editor(self):
+        return self.style.editor
+
+    @builtins.property
+    def property(self):
+        return self.style.property
+
+    def __repr__(self):
+        return "%s=%s" % (self.property, self.value)
+
+
+def _build_editable_styles(editable_variables):
+    return tuple((section_name, tuple(EditableStyle(
+        attribute['property'], default=attribute.get('default', ''),
+        editor=attribute.get('editor')) for attribute in section_attributes))
+        for section_name, section_attributes in editable_variables)
+
+
+EDITABLE_STYLES = _build_editable_styles(settings.BOOTSTRAP_EDITABLE_VARIABLES)
+
+
 def _add_editable_styles_context(context=None, less_variables=None):
     if context is None:
         context = {}
     if 'editable_styles' not in context:
-        if less_variables is None:
-            less_variables = {}
-        styles_context = copy.deepcopy(settings.BOOTSTRAP_EDITABLE_VARIABLES)
-        for _, section_attributes in styles_context:
-            for attribute in section_attributes:
-                attribute['value'] = less_variables.get(
-                    attribute['property'], attribute.get('default', ''))
+        if not less_variables:
+            styles_context = EDITABLE_STYLES
+        else:
+            styles_context = tuple((section_name, tuple(
+                EditableStyleValue(attribute, less_variables[attribute.property])
+                if attribute.property in less_variables else attribute
+                for attribute in section_attributes))
+                for section_name, section_attributes in EDITABLE_STYLES)
         context['editable_styles'] = styles_context
     return context
 
 
 @receiver(template_loaded, dispatch_uid="extended_templates_template_loaded")
+@receiver(template_rendered,
+    dispatch_uid="extended_templates_template_rendered")
 def _store_template_info(sender, **kwargs): #pylint: disable=unused-argument
+    templates = _RECORDED_TEMPLATES.get()
+    if templates is None:
+        return
     template = kwargs['template']
     if template.name in settings.TEMPLATES_BLACKLIST:
         # We don't show templates that cannot be edited.
         return
-    if not hasattr(_thread_locals, 'templates'):
-        _thread_locals.templates = OrderedDict()
-    if not template.name in _thread_locals.templates:
+    if not template.name in templates:
         # For some reasons the Django/Jinja2 framework might load the same
         # templates multiple times.
-        _thread_locals.templates.update({template.name:
-            {"name": template.name, "index": len(_thread_locals.templates)}})
+        templates.update({template.name:
+            {"name": template.name, "index": len(templates)}})
+
 
 def enable_instrumentation():
-    _thread_locals.templates = OrderedDict()
-    template_loaded.connect(_store_template_info)
-    template_rendered.connect(_store_template_info)
+    """
+    Starts recording the templates loaded and rendered in the current
+    context. Requests which do not enable instrumentation only pay
+    for a check on a context variable.
+
+    Returns a token to pass to ``disable_instrumentation``.
+    """
+    return _RECORDED_TEMPLATES.set(OrderedDict())
+
+
+def disable_instrumentation(token=None):
+    """
+    Stops recording templates in the current context and drops
+    the templates recorded so far.
+    """
+    if token is not None:
+        _RECORDED_TEMPLATES.reset(token)
+    else:
+        _RECORDED_TEMPLATES.set(None)
+
+
+@contextmanager
+def instrumentation():
+    """
+    Records the templates loaded and rendered inside the ``with`` block.
+
+    The recorded templates are yielded so they can be passed
+    to ``get_edition_tools_context_data`` once the block has exited,
+    at which point the current context is always cleaned up.
+    """
+    templates = OrderedDict()
+    token = _RECORDED_TEMPLATES.set(templates)
+    try:
+        yield templates
+    finally:
+        _RECORDED_TEMPLATES.reset(token)
 
-def disable_instrumentation():
-    template_rendered.disconnect(_store_template_info)
-    template_loaded.disconnect(_store_template_info)
 
-def get_edition_tools_context_data():
+def get_edition_tools_context_data(templates=None):
     context = {}
-    if hasattr(_thread_locals, 'templates'):
+    if templates is None:
+        templates = _RECORDED_TEMPLATES.get()
+    if templates is not None:
         context.update({'templates': json.dumps(
-            list(six.itervalues(_thread_locals.templates)))})
+            list(six.itervalues(templates)))})
     context = _add_editable_styles_context(context=context)
     return context
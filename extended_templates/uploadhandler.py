@@ -22,6 +22,8 @@
 # OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import base64, binascii, hashlib
+
 from django.core.cache import cache
 from django.core.files.uploadhandler import FileUploadHandler
 
@@ -68,3 +70,86 @@ class ProgressBarUploadHandler(FileUploadHandler):
     def upload_complete(self):
         if self.cache_key:
             cache.delete(self.cache_key)
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Computes the SHA-256 of uploaded files while they are received,
+    such that the content does not need to be read again afterwards.
+
+    This handler must be listed in ``FILE_UPLOAD_HANDLERS`` before
+    the handlers that store the file (ex: ``TemporaryFileUploadHandler``).
+    The hex digests are available through ``get_uploaded_file_sha256``.
+
+    Digests are recorded by file name and size. Multiple files uploaded
+    in the same request can have the same name, so all digests are kept.
+    """
+    def __init__(self, *args, **kwargs):
+        super(HashingUploadHandler, self).__init__(*args, **kwargs)
+        self.sha256 = None
+
+    def new_file(self, *args, **kwargs):
+        super(HashingUploadHandler, self).new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'uploaded_sha256'):
+            self.request.uploaded_sha256 = {}
+        self.request.uploaded_sha256.setdefault(
+            (self.file_name, file_size), []).append(self.sha256.hexdigest())
+
+
+def get_uploaded_file_sha256(request, uploaded_file):
+    """
+    Returns the SHA-256 hex digest of ``uploaded_file``.
+
+    The digest computed by ``HashingUploadHandler`` is used when available,
+    and not ambiguous. Otherwise the file is hashed chunk by chunk,
+    then rewound so it can be saved afterwards.
+    """
+    digests = set(getattr(request, 'uploaded_sha256', {}).get(
+        (uploaded_file.name, uploaded_file.size), []))
+    if len(digests) == 1:
+        return digests.pop()
+    sha256 = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha256.update(chunk)
+    uploaded_file.seek(0)
+    return sha256.hexdigest()
+
+
+def get_s3_object_sha256(s3_client, bucket_name, key_name):
+    """
+    Returns the SHA-256 hex digest and size of an object stored on S3.
+
+    When the object was uploaded with a SHA-256 checksum, S3 returns it
+    in the object metadata and the content is not downloaded. Otherwise
+    the content is streamed through the hash chunk by chunk.
+    """
+    #pylint:disable=import-outside-toplevel
+    from botocore.exceptions import ParamValidationError
+    try:
+        resp = s3_client.head_object(
+            Bucket=bucket_name, Key=key_name, ChecksumMode='ENABLED')
+    except ParamValidationError:
+        # Older versions of botocore do not know about `ChecksumMode`.
+        resp = s3_client.head_object(Bucket=bucket_name, Key=key_name)
+    size = resp.get('ContentLength')
+    checksum = resp.get('ChecksumSHA256')
+    # Checksums of multipart uploads are checksums of the parts checksums
+    # and end with "-{nb_parts}".
+    if checksum and '-' not in checksum:
+        try:
+            return binascii.hexlify(
+                base64.b64decode(checksum)).decode('ascii'), size
+        except (binascii.Error, ValueError):
+            pass
+    sha256 = hashlib.sha256()
+    data = s3_client.get_object(Bucket=bucket_name, Key=key_name)
+    for chunk in data['Body'].iter_chunks(chunk_size=1024 * 1024):
+        sha256.update(chunk)
+    return sha256.hexdigest(), size
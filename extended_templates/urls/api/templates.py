@@ -29,7 +29,7 @@ from ...import settings
 from ...compat import path, re_path
 from ...api.less_variables import LessVariableDetail, LessVariableListAPIView
 from ...api.sources import (SourceEditAPIView, SourceEditBaseAPIView,
-    SourceDetailAPIView)
+    SourceDetailAPIView, TemplateDependenciesAPIView)
 
 
 urlpatterns = [
@@ -48,6 +48,9 @@ urlpatterns = [
     path('sources/editables',
         SourceEditBaseAPIView.as_view(),
         name='extended_templates_api_edit_template_base'),
+    re_path(r'^dependencies(?:/(?P<page>\S+)?)?$',
+        TemplateDependenciesAPIView.as_view(),
+        name='extended_templates_api_dependencies'),
     re_path(r'^sources/(?P<page>\S+)?',
         SourceDetailAPIView.as_view(),
         name='extended_templates_api_sources'),
@@ -24,7 +24,8 @@
 
 from __future__ import unicode_literals
 
-import logging, os
+import logging, os, threading, time
+from collections import OrderedDict
 
 from django.conf import settings as django_settings
 from django.apps import apps as django_apps
@@ -35,10 +36,19 @@ from django.utils.module_loading import import_string
 
 from . import settings
 from .compat import (gettext_lazy as _, import_string, urljoin,
-    get_storage_class)
+    get_storage_class, six)
 
 LOGGER = logging.getLogger(__name__)
 
+# Storage instances, and the connection pools they hold, re-used across
+# requests. Entries are evicted least-recently-used first.
+_STORAGES_CACHE = OrderedDict()
+_STORAGES_CACHE_LOCK = threading.Lock()
+
+_ASSETS_DIRS = None
+_ASSET_RESOLVERS = {}
+_ASSET_RESOLVERS_LOCK = threading.Lock()
+
 
 validate_title = RegexValidator(#pylint: disable=invalid-name
     r'^[a-zA-Z0-9_\- ]+$',
@@ -51,6 +61,10 @@ validate_title = RegexValidator(#pylint: disable=invalid-name
 def get_assets_dirs():
     if settings.ASSETS_DIRS_CALLABLE:
         return import_string(settings.ASSETS_DIRS_CALLABLE)()
+    #pylint:disable=global-statement
+    global _ASSETS_DIRS
+    if _ASSETS_DIRS is not None:
+        return list(_ASSETS_DIRS)
     candidates = getattr(django_settings, 'STATICFILES_DIRS', None)
     if not candidates:
         static_root = getattr(django_settings, 'STATIC_ROOT', None)
@@ -62,9 +76,138 @@ def get_assets_dirs():
         if asset_dir.endswith(static_prefix):
             asset_dir = asset_dir[:-len(static_prefix)]
         assets_dirs += [asset_dir]
+    _ASSETS_DIRS = tuple(assets_dirs)
     return assets_dirs
 
 
+class AssetResolver(object):
+    """
+    Index of the files present in a list of assets directories, such that
+    finding an asset does not require to probe each directory in turn.
+
+    The index is built on first use. Found files are checked to still
+    exist. When a file is not found, the modification times of the indexed
+    directories are checked, at most once every
+    ``ASSETS_INDEX_REFRESH_INTERVAL`` seconds, and the index is rebuilt
+    when files were added or removed.
+    """
+    def __init__(self, assets_dirs):
+        self.assets_dirs = tuple(assets_dirs)
+        self._lock = threading.Lock()
+        self._files = None
+        self._dir_mtimes = {}
+        self._checked_at = 0
+
+    def _build(self):
+        files = []
+        dir_mtimes = {}
+        for base_path in self.assets_dirs:
+            rel_paths = set()
+            if not os.path.isdir(base_path):
+                dir_mtimes[base_path] = None
+            # Symbolic links to directories are followed, but each directory
+            # is only walked once, such that cycles do not loop forever.
+            visited = set()
+            for dirpath, dirnames, filenames in os.walk(
+                    base_path, followlinks=True):
+                try:
+                    statinfo = os.stat(dirpath)
+                except OSError:
+                    dirnames[:] = []
+                    continue
+                if (statinfo.st_dev, statinfo.st_ino) in visited:
+                    dirnames[:] = []
+                    continue
+                visited.add((statinfo.st_dev, statinfo.st_ino))
+                dir_mtimes[dirpath] = statinfo.st_mtime_ns
+                rel_dir = os.path.relpath(dirpath, base_path).replace(
+                    os.sep, '/')
+                for filename in filenames:
+                    rel_paths.add(filename if rel_dir == '.'
+                        else "%s/%s" % (rel_dir, filename))
+            files += [(base_path, rel_paths)]
+        self._files = files
+        self._dir_mtimes = dir_mtimes
+
+    def _is_stale(self):
+        for dirpath, mtime in six.iteritems(self._dir_mtimes):
+            try:
+                if os.stat(dirpath).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                if mtime is not None:
+                    return True
+        return False
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if (force or self._files is None or (
+                    now - self._checked_at >=
+                    settings.ASSETS_INDEX_REFRESH_INTERVAL
+                    and self._is_stale())):
+                self._build()
+            self._checked_at = now
+
+    def _lookup(self, path, strip_prefix=False):
+        rel_path = path.strip('/')
+        path_prefix = ""
+        rel_path_no_prefix = rel_path
+        if strip_prefix:
+            parts = rel_path.split('/')
+            if len(parts) > 1:
+                path_prefix = parts[0]
+                rel_path_no_prefix = '/'.join(parts[1:])
+        for base_path, rel_paths in self._files:
+            if path_prefix and base_path.endswith(path_prefix):
+                candidate = rel_path_no_prefix
+            else:
+                candidate = rel_path
+            if candidate in rel_paths:
+                return os.path.join(base_path, candidate)
+        return None
+
+    def find(self, path, strip_prefix=False):
+        """
+        Returns the absolute path of the first file matching the URL
+        ``path`` in the assets directories, or `None`.
+
+        When ``strip_prefix`` is `True`, the first part of ``path``
+        is dropped when looking into an assets directory whose name
+        ends with it (ex: '/static/css/email.css' is found
+        as 'css/email.css' in '/var/www/htdocs/static').
+        """
+        if self._files is None:
+            self.refresh()
+        found = self._lookup(path, strip_prefix=strip_prefix)
+        if found is not None and os.path.isfile(found):
+            return found
+        # The file is not indexed, or was removed since the index was built.
+        if (time.monotonic() - self._checked_at >=
+                settings.ASSETS_INDEX_REFRESH_INTERVAL):
+            self.refresh()
+            found = self._lookup(path, strip_prefix=strip_prefix)
+            if found is not None and os.path.isfile(found):
+                return found
+        return None
+
+
+def get_asset_resolver(assets_dirs=None):
+    """
+    Returns the ``AssetResolver`` shared by all threads
+    for ``assets_dirs`` (defaults to ``get_assets_dirs()``).
+    """
+    if assets_dirs is None:
+        assets_dirs = get_assets_dirs()
+    key = tuple(assets_dirs)
+    with _ASSET_RESOLVERS_LOCK:
+        resolver = _ASSET_RESOLVERS.get(key)
+        if resolver is None:
+            resolver = AssetResolver(key)
+            _ASSET_RESOLVERS[key] = resolver
+    return resolver
+
+
 def get_account_model():
     """
     Returns the ``Account`` model that is active in this project.
@@ -108,6 +251,46 @@ def get_default_storage(request, account=None, **kwargs):
 
 def get_default_storage_base(request, account=None, public=False,
                              base_url=None, **kwargs):
+    """
+    Returns the default storage for an account, re-using an instance
+    created by a previous call when possible.
+
+    Storages created with credentials from the session (ex: temporary
+    ``security_token``) are only re-used for ``STORAGE_CACHE_TTL`` seconds.
+    """
+    if not settings.STORAGE_CACHE_SIZE:
+        return _create_default_storage(request, account=account,
+            public=public, base_url=base_url, **kwargs)
+
+    session = request.session if request is not None else {}
+    credentials = tuple(session.get(key)
+        for key in ('access_key', 'secret_key', 'security_token'))
+    cache_key = (account.__class__.__name__, getattr(account, 'pk', account),
+        public, base_url, repr(sorted(kwargs.items())), credentials)
+    now = time.monotonic()
+    with _STORAGES_CACHE_LOCK:
+        entry = _STORAGES_CACHE.get(cache_key)
+        if entry is not None:
+            storage, expires_at = entry
+            if expires_at is None or now < expires_at:
+                _STORAGES_CACHE.move_to_end(cache_key)
+                return storage
+            del _STORAGES_CACHE[cache_key]
+
+    storage = _create_default_storage(request, account=account,
+        public=public, base_url=base_url, **kwargs)
+    expires_at = None
+    if any(credentials):
+        expires_at = now + settings.STORAGE_CACHE_TTL
+    with _STORAGES_CACHE_LOCK:
+        _STORAGES_CACHE[cache_key] = (storage, expires_at)
+        while len(_STORAGES_CACHE) > settings.STORAGE_CACHE_SIZE:
+            _STORAGES_CACHE.popitem(last=False)
+    return storage
+
+
+def _create_default_storage(request, account=None, public=False,
+                            base_url=None, **kwargs):
     # default implementation
     storage = None
     storage_class = get_storage_class()
@@ -119,23 +302,24 @@ def get_default_storage_base(request, account=None, public=False,
         storage_kwargs.update(**kwargs)
         if public:
             storage_kwargs.update({'default_acl': 'public-read'})
+        session = request.session if request is not None else {}
         for key in ['access_key', 'secret_key']:
-            if key in request.session:
-                storage_kwargs[key] = request.session[key]
+            if key in session:
+                storage_kwargs[key] = session[key]
         bucket_name = _get_bucket_name(account)
         location = _get_media_prefix(account)
         LOGGER.debug("create %s(bucket_name='%s', location='%s', %s)",
             storage_class.__name__, bucket_name, location, storage_kwargs)
         storage = storage_class(bucket_name=bucket_name, location=location,
             **storage_kwargs)
-        if 'security_token' in request.session:
-            storage.security_token = request.session['security_token']
+        if 'security_token' in session:
+            storage.security_token = session['security_token']
 
     if not storage:
         storage = _get_file_system_storage(
             account, public=public, base_url=base_url, **kwargs)
 
-    LOGGER.debug("[get_default_storage_base(account=%s, public=%s, kwargs=%s)]"\
+    LOGGER.debug("[_create_default_storage(account=%s, public=%s, kwargs=%s)]"\
         " returns %s", account, public, kwargs, storage.__class__)
     return storage
 
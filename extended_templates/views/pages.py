@@ -24,29 +24,291 @@
 
 #pylint:disable=unused-argument
 
+import hashlib, os, re, threading, uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+
 from bs4 import BeautifulSoup
 from django.template import loader
+from django.utils._os import safe_join
+from django.utils.html import conditional_escape
+from django.utils.translation import get_language
 from django.views.generic import TemplateView
 from django.template.response import TemplateResponse
 
-from ..compat import csrf, render_template, reverse
-from ..thread_locals import (enable_instrumentation,
-    _add_editable_styles_context, get_edition_tools_context_data)
+from ..compat import csrf, render_template, reverse, six
+from ..helpers import AsyncViewMixin
+from ..thread_locals import (_add_editable_styles_context,
+    get_edition_tools_context_data, instrumentation)
 from ..mixins import AccountMixin
-from ..models import get_show_edit_tools
+from ..models import get_active_theme, get_show_edit_tools
+from ..themes import get_template_path, get_theme_dir
 
 
-def inject_edition_tools(response, request=None, context=None,
-        body_top_template_name=None, body_bottom_template_name=None,
-        edit_frame_template_name=None):
-    #pylint:disable=too-many-arguments
+# Start and end tags of the HTML body. Comments as well as script
+# and style elements are matched as a whole so that tags inside them
+# are skipped over.
+BODY_TAGS_RE = re.compile(
+    br'<!--.*?-->|<(script|style)\b.*?</\1\s*>|<(/?)body\b[^>]*>',
+    re.IGNORECASE | re.DOTALL)
+
+# Start of comments, scripts and styles, which are not matched
+# by ``BODY_TAGS_RE`` until they are terminated.
+BODY_OPENERS_RE = re.compile(br'<!--|<(script|style)\b', re.IGNORECASE)
+
+# Context variables which differ on every request, and are substituted
+# in cached edition tools. They are not part of the cache key, otherwise
+# every request would add a new entry in the cache.
+EDITION_TOOLS_REQUEST_KEYS = ('access_key', 'aws_policy',
+    'aws_policy_signature', 'csrf_token', 'security_token', 'templates',
+    'x_amz_credential', 'x_amz_date')
+
+# Maximum number of rendered edition tools kept in the cache.
+EDITION_TOOLS_CACHE_SIZE = 256
+
+_EDITION_TOOLS_CACHE = OrderedDict()
+_EDITION_TOOLS_CACHE_LOCK = threading.Lock()
+_EDITION_TOOLS_PATHS = {}
+_PLACEHOLDER_SUFFIX = uuid.uuid4().hex
+
+# Maximum number of bytes held back while looking for the ``<body>`` tag
+# in streaming responses.
+MAX_HEAD_SIZE = 64 * 1024
+
+
+def find_body_offsets(content):
     """
-    Inject the edition tools into the html *content* and return
-    a BeautifulSoup object of the resulting content + tools.
+    Returns the offset right after the ``<body>`` start tag and the offset
+    of the ``</body>`` end tag in *content* (bytes).
+
+    The end offset is the length of *content* when there is no end tag.
+    Returns `None` when there is no start tag.
     """
-    content_type = response.get('content-type', '')
-    if not content_type.startswith('text/html'):
+    body_start = None
+    body_end = None
+    for match in BODY_TAGS_RE.finditer(content):
+        if match.group(2) is None:
+            # comment, script or style element
+            continue
+        if match.group(2):
+            body_end = match.start()
+        elif body_start is None:
+            body_start = match.end()
+    if body_start is None:
         return None
+    if body_end is None or body_end < body_start:
+        body_end = len(content)
+    return body_start, body_end
+
+
+def inject_edition_tools_chunks(chunks, body_top, body_bottom,
+                               max_head_size=MAX_HEAD_SIZE):
+    """
+    Yields *chunks* (bytes) unchanged except for *body_top* inserted
+    after the ``<body>`` start tag and *body_bottom* inserted before
+    the ``</body>`` end tag.
+
+    Chunks are only held back until the ``<body>`` start tag is found.
+    If it is not found in the first *max_head_size* bytes, the remaining
+    chunks are passed through and nothing is injected.
+    """
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        body_start = _find_body_start(head)
+        if body_start is not None:
+            yield head[:body_start]
+            yield body_top
+            head = head[body_start:]
+            break
+        if len(head) > max_head_size:
+            yield head
+            for chunk in chunks:
+                yield chunk
+            return
+    else:
+        # No ``<body>`` start tag.
+        yield head
+        return
+
+    # Looks for the last ``</body>`` end tag outside comments, scripts
+    # and styles, as `find_body_offsets` does. Bytes from the last candidate
+    # end tag, or from an unterminated comment, script or style, are held
+    # back (up to *max_head_size*) until we know more.
+    tail = head
+    keep = len(b'<script') - 1
+    for chunk in chunks:
+        tail += chunk
+        body_end, flush_end = _find_body_end(tail, keep)
+        if body_end is not None:
+            flush_end = body_end
+        if len(tail) - flush_end > max_head_size:
+            flush_end = len(tail) - keep
+        if flush_end > 0:
+            yield tail[:flush_end]
+            tail = tail[flush_end:]
+    body_end = _find_body_end(tail, 0)[0]
+    if body_end is None:
+        body_end = len(tail)
+    yield tail[:body_end]
+    yield body_bottom
+    yield tail[body_end:]
+
+
+def _find_body_start(content):
+    """
+    Returns the offset right after the ``<body>`` start tag in *content*
+    (bytes), or `None`.
+
+    Tags inside comments, scripts and styles are skipped. Scanning stops
+    at an unterminated comment, script or style since we cannot tell yet
+    if the tags after it are inside it.
+    """
+    pos = 0
+    for match in BODY_TAGS_RE.finditer(content):
+        if BODY_OPENERS_RE.search(content, pos, match.start()):
+            return None
+        if match.group(2) == b'':
+            return match.end()
+        pos = match.end()
+    return None
+
+
+def _find_body_end(content, keep):
+    """
+    Returns the offset of the last ``</body>`` end tag in *content* (bytes),
+    or `None`, and the offset up to which *content* can be passed through
+    while streaming.
+
+    Tags inside comments, scripts and styles are skipped. Scanning stops
+    at an unterminated comment, script or style, and *keep* bytes
+    at the end of *content* are left for the next chunk.
+    """
+    body_end = None
+    limit = len(content) - keep
+    pos = 0
+    for match in BODY_TAGS_RE.finditer(content):
+        opener = BODY_OPENERS_RE.search(content, pos, match.start())
+        if opener:
+            return body_end, min(opener.start(), limit)
+        if match.end() > limit:
+            return body_end, min(match.start(), limit)
+        if match.group(2):
+            body_end = match.start()
+        pos = match.end()
+    opener = BODY_OPENERS_RE.search(content, pos)
+    if opener:
+        return body_end, min(opener.start(), limit)
+    return body_end, limit
+
+
+def _get_edition_tools_path(template_name):
+    theme_path = safe_join(get_theme_dir(get_active_theme()),
+        'templates', template_name)
+    if os.path.exists(theme_path):
+        return theme_path
+    template_path = _EDITION_TOOLS_PATHS.get(template_name)
+    if template_path is None:
+        template_path = get_template_path(relative_path=template_name)
+        _EDITION_TOOLS_PATHS[template_name] = template_path
+    return template_path
+
+
+def _render_edition_tools(template_name, context, request, cache=False):
+    """
+    Renders the edition tools template *template_name*.
+
+    When *cache* is `True`, the template is rendered without the request,
+    hence without context processors, with placeholders for the (truthy)
+    context variables listed in ``EDITION_TOOLS_REQUEST_KEYS``. The result
+    is cached per template modification time, theme, language, user,
+    remaining context variables and names of the variables replaced
+    by placeholders. Later requests only substitute the placeholders
+    by their actual values, HTML-escaped where the template engine
+    escaped the placeholder.
+
+    Caching is only correct when the edition tools templates do not rely
+    on context processors, all per-request variables they use are listed
+    in ``EDITION_TOOLS_REQUEST_KEYS``, and these variables are only output
+    as-is or through the `safe` filter, or tested for truthiness
+    (ex: ``{% if access_key %}``). Other filters and comparisons see
+    the placeholder instead of the actual value. Caching is thus off
+    by default.
+    """
+    if not template_name:
+        return ""
+    if not cache:
+        template = loader.get_template(template_name)
+        return render_template(template, context, request).strip()
+
+    template_path = _get_edition_tools_path(template_name)
+    static_context = {}
+    placeholders = {}
+    for key, val in six.iteritems(context):
+        # Falsy values are kept in the static context such that
+        # ``{% if key %}`` renders the same as without the cache.
+        if key in EDITION_TOOLS_REQUEST_KEYS and val:
+            # The '&' tells apart placeholders which were HTML-escaped
+            # by the template engine from the ones output as-is.
+            placeholders[key] = "__edition_tools_%s_%s&__" % (
+                key, _PLACEHOLDER_SUFFIX)
+        else:
+            static_context[key] = val
+    user = getattr(request, 'user', None)
+    cache_key = (template_name, template_path,
+        os.stat(template_path).st_mtime_ns, get_active_theme(),
+        get_language(), getattr(user, 'pk', None),
+        hashlib.sha256(repr(sorted(six.iteritems(static_context))).encode(
+            'utf-8')).hexdigest(),
+        tuple(sorted(placeholders)))
+    with _EDITION_TOOLS_CACHE_LOCK:
+        rendered = _EDITION_TOOLS_CACHE.get(cache_key)
+        if rendered is not None:
+            _EDITION_TOOLS_CACHE.move_to_end(cache_key)
+    if rendered is None:
+        template = loader.get_template(template_name)
+        static_context.update(placeholders)
+        rendered = render_template(template, static_context, None).strip()
+        with _EDITION_TOOLS_CACHE_LOCK:
+            _EDITION_TOOLS_CACHE[cache_key] = rendered
+            while len(_EDITION_TOOLS_CACHE) > EDITION_TOOLS_CACHE_SIZE:
+                _EDITION_TOOLS_CACHE.popitem(last=False)
+    for key, placeholder in six.iteritems(placeholders):
+        rendered = rendered.replace(conditional_escape(placeholder),
+            conditional_escape(context[key]))
+        rendered = rendered.replace(placeholder, str(context[key]))
+    return rendered
+
+
+def _inject_edition_tools_dom(content, body_top, body_bottom, edit_frame):
+    soup = None
+    if body_top:
+        soup = BeautifulSoup(content, 'html5lib')
+        if soup.body:
+            # Implementation Note: we have to use ``.body.next`` here
+            # because html5lib "fixes" our HTML by adding missing
+            # html/body tags. Furthermore if we use
+            #``soup.body.insert(1, BeautifulSoup(body_top, 'html.parser'))``
+            # instead, later on ``soup.find_all(class_=...)`` returns
+            # an empty set though ``soup.prettify()`` outputs the full
+            # expected HTML text.
+            soup.body.insert(1, BeautifulSoup(
+                body_top, 'html5lib').body.next)
+    if body_bottom:
+        if not soup:
+            soup = BeautifulSoup(content, 'html5lib')
+        if soup.body:
+            soup.body.append(BeautifulSoup(body_bottom, 'html.parser'))
+    if edit_frame:
+        soup = BeautifulSoup(edit_frame, 'html5lib')
+    return soup
+
+
+def _render_edition_tools_parts(request, context,
+        body_top_template_name, body_bottom_template_name,
+        edit_frame_template_name, cache=False):
+    #pylint:disable=too-many-arguments
     if context is None:
         context = {}
     if 'urls' not in context:
@@ -61,42 +323,96 @@ def inject_edition_tools(response, request=None, context=None,
                 'api_medias': reverse('extended_templates_api_assets')
         }}})
     context.update(csrf(request))
-    soup = None
-    if body_top_template_name:
-        template = loader.get_template(body_top_template_name)
-        body_top = render_template(template, context, request).strip()
-        if body_top:
-            if not soup:
-                soup = BeautifulSoup(response.content, 'html5lib')
-            if soup and soup.body:
-                # Implementation Note: we have to use ``.body.next`` here
-                # because html5lib "fixes" our HTML by adding missing
-                # html/body tags. Furthermore if we use
-                #``soup.body.insert(1, BeautifulSoup(body_top, 'html.parser'))``
-                # instead, later on ``soup.find_all(class_=...)`` returns
-                # an empty set though ``soup.prettify()`` outputs the full
-                # expected HTML text.
-                soup.body.insert(1, BeautifulSoup(
-                    body_top, 'html5lib').body.next)
-    if body_bottom_template_name:
-        template = loader.get_template(body_bottom_template_name)
-        body_bottom = render_template(template, context, request).strip()
-        if body_bottom:
-            if not soup:
-                soup = BeautifulSoup(response.content, 'html5lib')
-            if soup and soup.body:
-                soup.body.append(BeautifulSoup(body_bottom, 'html.parser'))
-
-    if edit_frame_template_name:
-        template = loader.get_template(edit_frame_template_name)
-        edit_frame = render_template(template, context, request).strip()
+    body_top = _render_edition_tools(
+        body_top_template_name, context, request, cache=cache)
+    body_bottom = _render_edition_tools(
+        body_bottom_template_name, context, request, cache=cache)
+    edit_frame = _render_edition_tools(
+        edit_frame_template_name, context, request, cache=cache)
+    return body_top, body_bottom, edit_frame
+
+
+def inject_edition_tools(response, request=None, context=None,
+        body_top_template_name=None, body_bottom_template_name=None,
+        edit_frame_template_name=None):
+    #pylint:disable=too-many-arguments
+    """
+    Inject the edition tools into the html *content* and return
+    a BeautifulSoup object of the resulting content + tools, or `None`
+    if nothing was injected.
+
+    See `splice_edition_tools` to inject the tools without parsing
+    the content.
+    """
+    content_type = response.get('content-type', '')
+    if not content_type.startswith('text/html'):
+        return None
+    body_top, body_bottom, edit_frame = _render_edition_tools_parts(
+        request, context, body_top_template_name, body_bottom_template_name,
+        edit_frame_template_name)
+    return _inject_edition_tools_dom(
+        response.content, body_top, body_bottom, edit_frame)
+
+
+def splice_edition_tools(response, request=None, context=None,
+        body_top_template_name=None, body_bottom_template_name=None,
+        edit_frame_template_name=None, parse_dom=False, cache=False):
+    #pylint:disable=too-many-arguments
+    """
+    Inject the edition tools into the html *content* and return
+    the resulting content + tools, suitable to set ``response.content``,
+    or `None` if nothing was injected.
+
+    The tools are spliced into the content right after the ``<body>``
+    start tag and right before the ``</body>`` end tag, and `bytes` are
+    returned. When *parse_dom* is `True`, or the content does not have
+    a ``<body>`` tag, the content is parsed as a full DOM tree instead
+    (as in `inject_edition_tools`), and a `str` is returned.
+
+    For streaming responses, ``response.streaming_content`` is wrapped
+    such that the tools are injected as chunks go through, and `None`
+    is returned.
+
+    When *cache* is `True`, the rendered tools are cached and only
+    per-request variables are filled in (see ``_render_edition_tools``).
+    """
+    content_type = response.get('content-type', '')
+    if not content_type.startswith('text/html'):
+        return None
+    body_top, body_bottom, edit_frame = _render_edition_tools_parts(
+        request, context, body_top_template_name, body_bottom_template_name,
+        edit_frame_template_name, cache=cache)
+    if not (body_top or body_bottom or edit_frame):
+        return None
+
+    charset = getattr(response, 'charset', None) or 'utf-8'
+    if getattr(response, 'streaming', False):
         if edit_frame:
-            if not soup:
-                soup = BeautifulSoup(response.content, 'html5lib')
-            edit_soup = BeautifulSoup(edit_frame, 'html5lib')
-            soup = edit_soup
+            response.streaming_content = [edit_frame.encode(charset)]
+        else:
+            response.streaming_content = inject_edition_tools_chunks(
+                response.streaming_content,
+                body_top.encode(charset), body_bottom.encode(charset))
+        if response.has_header('Content-Length'):
+            del response['Content-Length']
+        return None
 
-    return soup
+    content = response.content
+    if not parse_dom:
+        if edit_frame:
+            return edit_frame
+        offsets = find_body_offsets(content)
+        if offsets:
+            body_start, body_end = offsets
+            return b''.join([content[:body_start],
+                body_top.encode(charset), content[body_start:body_end],
+                body_bottom.encode(charset), content[body_end:]])
+    soup = _inject_edition_tools_dom(content, body_top, body_bottom, edit_frame)
+    if soup is None:
+        return None
+    # str(soup) instead of soup.prettify() to avoid
+    # trailing whitespace on a reformatted HTML textarea
+    return str(soup)
 
 
 class PageMixin(object):
@@ -106,30 +422,42 @@ class PageMixin(object):
     body_top_template_name = None
     body_bottom_template_name= 'extended_templates/_body_bottom_edit_tools.html'
     edit_frame_template_name = None
+    parse_dom = False
+    # Opt-in, see `_render_edition_tools` for the requirements.
+    cache_edition_tools = False
 
-    def add_edition_tools(self, response, context=None):
-        if context is None:
-            context = {}
-        context.update(get_edition_tools_context_data())
+    @property
+    def show_edit_tools(self):
+        if not hasattr(self, '_show_edit_tools'):
+            self._show_edit_tools = get_show_edit_tools(self.request)
+        return self._show_edit_tools
 
-        if not get_show_edit_tools(self.request):
+    def add_edition_tools(self, response, context=None, templates=None):
+        if not self.show_edit_tools:
             return None
 
-        return inject_edition_tools(
+        if context is None:
+            context = {}
+        context.update(get_edition_tools_context_data(templates=templates))
+
+        return splice_edition_tools(
             response, request=self.request, context=context,
             body_top_template_name=self.body_top_template_name,
-            body_bottom_template_name=self.body_bottom_template_name)
+            body_bottom_template_name=self.body_bottom_template_name,
+            parse_dom=self.parse_dom, cache=self.cache_edition_tools)
 
 
     def get(self, request, *args, **kwargs):
         #pylint: disable=too-many-statements, too-many-locals
-        enable_instrumentation()
-        response = super(PageMixin, self).get(request, *args, **kwargs)
-        if isinstance(response, TemplateResponse):
-            response.render()
-        soup = self.add_edition_tools(response)
-        if soup:
-            response.content = str(soup)
+        # Templates are only recorded for users who will see the edit tools.
+        with (instrumentation() if self.show_edit_tools
+              else nullcontext()) as templates:
+            response = super(PageMixin, self).get(request, *args, **kwargs)
+            if isinstance(response, TemplateResponse):
+                response.render()
+        content = self.add_edition_tools(response, templates=templates)
+        if content:
+            response.content = content
         return response
 
 
@@ -169,3 +497,15 @@ class EditView(AccountMixin, TemplateView):
             }})
         context = _add_editable_styles_context(context=context)
         return context
+
+
+class AsyncPageView(AsyncViewMixin, PageView):
+    """
+    ``PageView`` which renders the page in a worker thread under ASGI.
+    """
+
+
+class AsyncEditView(AsyncViewMixin, EditView):
+    """
+    ``EditView`` which renders the page in a worker thread under ASGI.
+    """
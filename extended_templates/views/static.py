@@ -31,7 +31,8 @@ from django.views.generic import View
 from django.contrib.staticfiles.views import serve as django_static_serve
 
 from .. import settings
-from ..utils import get_assets_dirs
+from ..helpers import AsyncViewMixin
+from ..utils import get_asset_resolver, get_assets_dirs
 
 LOGGER = logging.getLogger(__name__)
 
@@ -58,9 +59,10 @@ class AssetView(View):
             source_root = self.source_root
             if not source_root:
                 source_root = settings.ASSETS_SOURCES_DIR
-            for base_path in get_assets_dirs():
-                cache_name = safe_join(base_path, rel_path)
-
+            assets_dirs = get_assets_dirs()
+            resolver = get_asset_resolver(assets_dirs)
+            cache_name = resolver.find(rel_path)
+            if cache_name:
                 LOGGER.debug(
                     "compare timestamps of cache file %s to sources in %s",
                     cache_name, source_root)
@@ -81,17 +83,17 @@ class AssetView(View):
                                 break
                         if rebuild:
                             break
-                    cache_root = base_path
-                    break
+                    cache_root = cache_name[
+                        :-len(rel_path.strip('/'))].rstrip(os.sep)
                 except FileNotFoundError:
-                    # If we cannot find the file, then let's continue,
-                    # maybe it is present in another assets directory.
+                    # The file was removed since the index was last
+                    # refreshed.
                     LOGGER.debug("cannot stat(%s)", str(cache_name))
 
             if not cache_root or rebuild:
                 LOGGER.debug("rebuild %s", str(rel_path))
                 if not cache_root:
-                    cache_root = get_assets_dirs()[0]
+                    cache_root = assets_dirs[0]
                 scss_filename = safe_join(source_root, source[0])
                 css_filename = safe_join(cache_root, rel_path)
                 cmd = [settings.SASSC_BIN, scss_filename, css_filename]
@@ -102,6 +104,7 @@ class AssetView(View):
                     LOGGER.error("%s", str(err))
                     os.remove(css_filename)
                     assert not os.path.exists(css_filename)
+                resolver.refresh(force=True)
             else:
                 LOGGER.debug("no rebuild of %s", str(rel_path))
 
@@ -114,3 +117,10 @@ class AssetView(View):
         if source:
             resp['Cache-Control'] = 'no-cache'
         return resp
+
+
+class AsyncAssetView(AsyncViewMixin, AssetView):
+    """
+    ``AssetView`` which compiles and serves assets in a worker thread
+    under ASGI, so a long running ``sassc`` does not block other requests.
+    """
@@ -31,7 +31,7 @@ from deployutils.apps.django_deployutils.themes import package_theme
 
 from .. import settings
 from ..compat import six, reverse
-from ..helpers import update_context_urls
+from ..helpers import AsyncViewMixin, update_context_urls
 from ..mixins import AccountMixin, ThemePackageMixin
 from .pages import PageMixin
 
@@ -50,6 +50,13 @@ class ThemePackagesView(PageMixin, AccountMixin, TemplateView):
         return context
 
 
+class AsyncThemePackagesView(AsyncViewMixin, ThemePackagesView):
+    """
+    ``ThemePackagesView`` which renders the page in a worker thread
+    under ASGI.
+    """
+
+
 class ThemePackageDownloadView(ThemePackageMixin, View):
     """
     URL end point to download the theme as a .zip package
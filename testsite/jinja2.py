@@ -14,6 +14,7 @@ from jinja2.ext import i18n
 from jinja2.sandbox import SandboxedEnvironment as Jinja2Environment
 from extended_templates import signals as extended_templates_signals
 from extended_templates.compat import import_string, reverse, six
+from extended_templates.themes import get_bytecode_cache
 
 import testsite.templatetags.testsite_tags
 
@@ -38,6 +39,9 @@ def environment(**options):
     # If we don't force ``auto_reload`` to True, in DEBUG=0, the templates
     # would only be compiled on the first edit.
     options.update({'auto_reload': True, 'cache_size': 0})
+    # Compiled templates are stored on disk and only recompiled
+    # when their source changes.
+    options.setdefault('bytecode_cache', get_bytecode_cache())
     if 'loader' in options:
         if isinstance(options['loader'], six.string_types):
             loader_class = import_string(options['loader'])
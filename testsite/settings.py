@@ -163,6 +163,7 @@ WSGI_APPLICATION = 'testsite.wsgi.application'
 
 FILE_UPLOAD_HANDLERS = (
     "extended_templates.uploadhandler.ProgressBarUploadHandler",
+    "extended_templates.uploadhandler.HashingUploadHandler",
     "django.core.files.uploadhandler.MemoryFileUploadHandler",
     "django.core.files.uploadhandler.TemporaryFileUploadHandler",
 )
@@ -248,6 +249,11 @@ TEMPLATES = [
 ]
 
 
+EXTENDED_TEMPLATES = {
+    'TEMPLATES_BYTECODE_CACHE_DIR': os.path.join(RUN_DIR, '.cache', 'jinja2'),
+}
+
+
 # Database
 # --------
 DATABASES = {
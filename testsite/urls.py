@@ -29,7 +29,7 @@ from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from extended_templates.compat import include, path, re_path
 from extended_templates.views.pages import PageView, EditView
 
-from .views import PdfView
+from .views import PdfView, StreamingPageView
 
 if settings.DEBUG:
     urlpatterns = staticfiles_urlpatterns() + [
@@ -57,6 +57,8 @@ urlpatterns += [
         name='extended_templates_edit'),
     path('content/', PageView.as_view(template_name='index.html')),
     path('pdf/', PdfView.as_view()),
+    path('streaming/', StreamingPageView.as_view(
+        template_name='streaming.html')),
     re_path(r'^$', PageView.as_view(template_name='index.html'),
         name='homepage'),
 ]
@@ -22,10 +22,12 @@
 # OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
 # ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.views.generic import TemplateView
 
 from extended_templates.backends import get_template
+from extended_templates.views.pages import PageView
 
 
 class PdfView(TemplateView):
@@ -43,3 +45,19 @@ class PdfView(TemplateView):
         template = get_template('pdfview.pdf')
         response.write(template.render(self.get_context_data(**kwargs)))
         return response
+
+
+class StreamingPageView(PageView):
+    """
+    Page streamed in small chunks, to check the edit tools are injected
+    before the actual ``</body>`` end tag.
+    """
+    chunk_size = 64
+
+    def render_to_response(self, context, **response_kwargs):
+        content = render_to_string(
+            self.get_template_names(), context, request=self.request)
+        return StreamingHttpResponse(
+            (content[idx:idx + self.chunk_size]
+             for idx in range(0, len(content), self.chunk_size)),
+            **response_kwargs)